@@ -0,0 +1,193 @@
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+import soundfile as sf
+from audio_synthesis_api import (
+    PREVIEW_PEAK, SAMPLE_RATE, STREAM_BLOCK_SIZE, LoopedStem, normalize_preview,
+    stream_stem
+)
+
+# Output codecs selectable for previews and downloads
+CODECS = {
+    'wav': {'format': 'WAV', 'subtype': 'PCM_16', 'mime': 'audio/wav', 'label': 'WAV (PCM)'},
+    'flac': {'format': 'FLAC', 'subtype': 'PCM_16', 'mime': 'audio/flac', 'label': 'FLAC (lossless)'},
+    'ogg': {'format': 'OGG', 'subtype': 'VORBIS', 'mime': 'audio/ogg', 'label': 'OGG Vorbis'},
+}
+PREVIEW_CODEC = 'ogg'
+DOWNLOAD_CODEC = 'flac'
+
+# Samples handed to the encoder per write
+ENCODE_CHUNK_SIZE = 65536
+
+# Per-codec totals for this process, see codec_stats()
+_encode_totals = {
+    codec: {"files": 0, "bytes": 0, "audio_seconds": 0.0, "encode_seconds": 0.0}
+    for codec in CODECS
+}
+_totals_lock = threading.Lock()
+
+def open_encoder(output, codec, sample_rate=SAMPLE_RATE):
+    """Mono sf.SoundFile writing `codec` to a path or file-like object"""
+    spec = CODECS[codec]
+    return sf.SoundFile(output, 'w', samplerate=sample_rate, channels=1,
+                        format=spec['format'], subtype=spec['subtype'])
+
+def record_encode(codec, n_bytes, audio_seconds, encode_seconds):
+    with _totals_lock:
+        totals = _encode_totals[codec]
+        totals["files"] += 1
+        totals["bytes"] += n_bytes
+        totals["audio_seconds"] += audio_seconds
+        totals["encode_seconds"] += encode_seconds
+
+def encode_audio(audio, codec=PREVIEW_CODEC, sample_rate=SAMPLE_RATE,
+                 chunk_size=ENCODE_CHUNK_SIZE):
+    """Encode mono float audio to bytes in `codec`, `chunk_size` samples at
+    a time"""
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    with open_encoder(buffer, codec, sample_rate) as out:
+        for offset in range(0, len(audio), chunk_size):
+            out.write(audio[offset:offset + chunk_size])
+    data = buffer.getvalue()
+    record_encode(codec, len(data), len(audio) / sample_rate,
+                  time.perf_counter() - start)
+    return data
+
+def encode_preview(audio, codec=PREVIEW_CODEC, sample_rate=SAMPLE_RATE):
+    """Normalize a rendered stem and encode it into compact in-memory bytes.
+
+    The bytes go straight to st.audio, to pygame through a BytesIO and to
+    mixdown, so previews never touch disk.
+    """
+    return encode_audio(normalize_preview(audio), codec, sample_rate)
+
+def encode_stem_stream(music_data, name, output, codec=PREVIEW_CODEC,
+                       block_size=STREAM_BLOCK_SIZE, sample_rate=SAMPLE_RATE):
+    """Synthesize and encode one stem block by block into `output`.
+
+    The full-length stem never exists in memory. Like mixdown, a first
+    pass only measures the peak and a second synthesizes again to encode,
+    so the result peaks at exactly PREVIEW_PEAK, matching encode_preview,
+    for about twice the synthesis time. Returns the stem duration in
+    seconds.
+    """
+    start = time.perf_counter()
+    peak = 0.0
+    for block in stream_stem(music_data, name, block_size, sample_rate=sample_rate):
+        peak = max(peak, float(abs(block).max(initial=0.0)))
+    gain = PREVIEW_PEAK / peak if peak > 0 else 0.0
+    n_samples = 0
+    with open_encoder(output, codec, sample_rate) as out:
+        for block in stream_stem(music_data, name, block_size, sample_rate=sample_rate):
+            out.write(block * gain)
+            n_samples += len(block)
+
+    if hasattr(output, "seek"):
+        n_bytes = output.seek(0, io.SEEK_END)
+    else:
+        n_bytes = os.path.getsize(output)
+    record_encode(codec, n_bytes, n_samples / sample_rate, time.perf_counter() - start)
+    return n_samples / sample_rate
+
+def codec_stats():
+    """Encode time and output size per codec for this process.
+
+    `ratio` compares the output with 16-bit PCM of the same audio and
+    `realtime` is audio seconds encoded per second of encoding work.
+    """
+    stats = {}
+    with _totals_lock:
+        for codec, totals in _encode_totals.items():
+            pcm_bytes = totals["audio_seconds"] * SAMPLE_RATE * 2
+            stats[codec] = dict(
+                totals,
+                ratio=totals["bytes"] / pcm_bytes if pcm_bytes else None,
+                realtime=(totals["audio_seconds"] / totals["encode_seconds"]
+                          if totals["encode_seconds"] else None)
+            )
+    return stats
+
+class AudioBufferStore:
+    """Process-wide home for preview audio, keyed by session id.
+
+    Each session holds the stems of its latest generation, as encoded
+    bytes, raw sample arrays or LoopedStems. When
+    the total passes `max_bytes`, the least recently used sessions lose
+    their audio first; the session being stored is never evicted.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._sessions = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size(buffers):
+        # Bytes of encoded data, raw sample arrays and looped passes alike
+        return sum(data.nbytes if isinstance(data, LoopedStem) else memoryview(data).nbytes
+                   for data in buffers.values())
+
+    def put(self, session_id, buffers):
+        """Replace a session's audio, then evict others to fit the budget"""
+        with self._lock:
+            self._drop(session_id)
+            self._sessions[session_id] = (buffers, time.time())
+            self._bytes += self._size(buffers)
+            for other in list(self._sessions):
+                if self._bytes <= self.max_bytes:
+                    break
+                if other != session_id:
+                    self._drop(other)
+
+    def get(self, session_id):
+        """The session's buffers, or None if released or evicted"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            self._sessions.move_to_end(session_id)
+            self._sessions[session_id] = (entry[0], time.time())
+            return entry[0]
+
+    def release(self, session_id):
+        with self._lock:
+            self._drop(session_id)
+
+    def prune(self, is_active):
+        """Release audio of every session for which `is_active(id)` is False"""
+        with self._lock:
+            for session_id in list(self._sessions):
+                if not is_active(session_id):
+                    self._drop(session_id)
+
+    def _drop(self, session_id):
+        entry = self._sessions.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= self._size(entry[0])
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes
+            }
+
+if __name__ == "__main__":
+    # Example usage: encode the canned composition with every codec
+    from fake_openai_server import CANNED_MUSIC_DATA
+    from audio_synthesis_api import render_stems
+
+    stems = render_stems(CANNED_MUSIC_DATA)
+    for codec in CODECS:
+        for audio in stems.values():
+            encode_preview(audio, codec)
+
+    print(f"{'codec':<6} {'bytes':>10} {'vs PCM':>8} {'encode (s)':>11} {'x realtime':>11}")
+    for codec, stats in codec_stats().items():
+        print(f"{codec:<6} {stats['bytes']:>10} {stats['ratio']:>8.2f} "
+              f"{stats['encode_seconds']:>11.3f} {stats['realtime']:>11.0f}")
@@ -0,0 +1,550 @@
+import copy
+import time
+from collections import OrderedDict
+import numpy as np
+from note_table import as_note_table
+from drum_bank import DrumBank
+
+SAMPLE_RATE = 44100
+
+_drum_banks = {}
+
+def get_drum_bank(sample_rate=SAMPLE_RATE):
+    """The General MIDI drum bank, memory-mapped from its cache on first
+    use rather than at import"""
+    bank = _drum_banks.get(sample_rate)
+    if bank is None:
+        bank = _drum_banks[sample_rate] = DrumBank.load(sample_rate)
+    return bank
+
+# Smallest FFT size for overlap-add mixing of dense drum tracks; longer
+# samples use the next power of two at least twice their length
+DRUM_FFT_SIZE = 16384
+# Cost model choosing between one slice add per hit and overlap-add, in
+# units of one sample of slice add: a hit adds a fixed call overhead, an
+# FFT block costs DRUM_FFT_COST * n_fft * log2(n_fft). Fitted on the GM
+# bank, where overlap-add wins above roughly 70-120 hits per second per
+# sound.
+DRUM_HIT_OVERHEAD = 13000
+DRUM_FFT_COST = 2.8
+
+def _mix_hits(audio, starts, gains, sample):
+    """Add one drum sample into `audio` at every start, scaled by gains"""
+    length = len(audio)
+    sample_len = len(sample)
+    n_fft = max(DRUM_FFT_SIZE, 1 << (2 * sample_len - 1).bit_length())
+
+    # Split the timeline into blocks; only blocks holding an onset get mixed
+    hop = n_fft - sample_len + 1
+    blocks = starts // hop
+    active, slot = np.unique(blocks, return_inverse=True)
+
+    fft_cost = DRUM_FFT_COST * n_fft * (n_fft.bit_length() - 1) * len(active)
+    if len(starts) * (sample_len + DRUM_HIT_OVERHEAD) <= fft_cost:
+        # Sparse hits: add each one straight into the buffer
+        for start, gain in zip(starts.tolist(), gains.tolist()):
+            end = min(start + sample_len, length)
+            audio[start:end] += gain * sample[:end - start]
+        return
+
+    # Dense hits: scatter onsets into one impulse train per block, convolve
+    # with the sample in the frequency domain, then overlap-add the blocks.
+    # Cost follows the number of active blocks rather than hits times
+    # sample length.
+    trains = np.zeros((len(active), hop))
+    np.add.at(trains, (slot, starts - blocks * hop), gains)
+    mixed = np.fft.irfft(np.fft.rfft(trains, n_fft) * np.fft.rfft(sample, n_fft), n_fft)
+
+    tail = n_fft - hop
+    out = np.zeros((-(-length // hop) + 1, hop))
+    out[active] += mixed[:, :hop]
+    out[active + 1, :tail] += mixed[:, hop:]
+    audio += out.ravel()[:length]
+
+def render_drum_hits(onsets, pitches, length, velocities=None, bank=None,
+                     sample_rate=SAMPLE_RATE):
+    """Mix every drum hit into a buffer of `length` samples in one batch.
+
+    `onsets` are start times in seconds, `pitches` General MIDI drum
+    numbers and `velocities` 0-127 (100 when not given). Hits that run past
+    the end of the buffer are clipped instead of dropped.
+    """
+    bank = get_drum_bank(sample_rate) if bank is None else bank
+    audio = np.zeros(length)
+
+    starts = (np.asarray(onsets, dtype=np.float64) * sample_rate).astype(np.int64)
+    if velocities is None:
+        velocities = np.full(len(starts), 100)
+    rows, gains = bank.lookup(pitches, velocities)
+    keep = (starts >= 0) & (starts < length) & (gains > 0)
+    starts, rows, gains = starts[keep], rows[keep], gains[keep]
+
+    # Each sound is mixed on its own, since rows differ in length
+    for row in np.unique(rows).tolist():
+        hits = rows == row
+        _mix_hits(audio, starts[hits], gains[hits], bank.sample(row))
+    return audio
+
+class WavetableSynth:
+    """Sine synthesizer matching PrettyMIDI.synthesize, with rendered notes
+    kept in a bounded LRU cache.
+
+    Notes are keyed by (program, pitch, duration in samples, velocity), so a
+    repeated note or chord tone costs one buffer add instead of a fresh sine.
+    Pitch bends are not applied; MIDIConverter never writes them.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE, max_cache_bytes=64 * 1024 * 1024):
+        self.sample_rate = sample_rate
+        self.max_cache_bytes = max_cache_bytes
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _render_note(self, pitch, n_samples, velocity):
+        """Waveform for one note, same envelope as PrettyMIDI"""
+        fs = self.sample_rate
+        frequency = 440.0 * 2.0 ** ((pitch - 69) / 12.0)
+        n = np.arange(n_samples)
+        waveform = np.sin(2 * np.pi * frequency / fs * n)
+
+        # Exponential decay with a 100ms fade-out to avoid clicks
+        envelope = np.exp(-n / (1.0 * fs))
+        fade_len = int(.1 * fs)
+        if n_samples > fade_len:
+            envelope[-fade_len:] *= np.linspace(1, 0, fade_len)
+        else:
+            envelope *= np.linspace(1, 0, n_samples)
+        envelope *= velocity
+        return envelope * waveform
+
+    def note_waveform(self, program, pitch, n_samples, velocity):
+        """Cached waveform for a note; callers must not modify it"""
+        key = (program, pitch, n_samples, velocity)
+        waveform = self._cache.get(key)
+        if waveform is not None:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return waveform
+
+        self.misses += 1
+        waveform = self._render_note(pitch, n_samples, velocity)
+        waveform.setflags(write=False)
+        if waveform.nbytes <= self.max_cache_bytes:
+            self._cache[key] = waveform
+            self._cache_bytes += waveform.nbytes
+            while self._cache_bytes > self.max_cache_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= evicted.nbytes
+        return waveform
+
+    def render_notes(self, notes, program=0, out=None):
+        """Add (start, end, pitch, velocity) notes, in seconds, into `out`.
+
+        Allocates a buffer one second longer than the last note when `out`
+        is not given, like PrettyMIDI does.
+        """
+        fs = self.sample_rate
+        if out is None:
+            end_time = max((note[1] for note in notes), default=0)
+            out = np.zeros(int(fs * (end_time + 1)))
+
+        for start_time, end_time, pitch, velocity in notes:
+            start = int(fs * start_time)
+            end = min(int(fs * end_time), len(out))
+            if end <= start:
+                continue
+            waveform = self.note_waveform(program, pitch, int(fs * end_time) - start, velocity)
+            out[start:end] += waveform[:end - start]
+        return out
+
+    def synthesize(self, midi):
+        """Render every non-drum instrument of a PrettyMIDI object, unnormalized"""
+        instruments = [inst for inst in midi.instruments if not inst.is_drum]
+        if not instruments:
+            return np.array([])
+
+        length = max(int(self.sample_rate * (inst.get_end_time() + 1))
+                     for inst in midi.instruments)
+        audio = np.zeros(length)
+        for inst in instruments:
+            notes = [(note.start, note.end, note.pitch, note.velocity)
+                     for note in inst.notes]
+            self.render_notes(notes, inst.program, out=audio)
+        return audio
+
+    def cache_info(self):
+        """Hit/miss counters and memory use of the note cache"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._cache),
+            "bytes": self._cache_bytes,
+            "max_bytes": self.max_cache_bytes
+        }
+
+    def clear_cache(self):
+        self._cache.clear()
+        self._cache_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+STEM_NAMES = ('instrument', 'bass', 'drums')
+
+# Peak level of preview audio after normalization
+PREVIEW_PEAK = 0.7
+
+# Puts rendered stems on one level, where a full-velocity note or drum hit
+# peaks near 1.0, so they can be summed without measuring each one. The
+# synth uses raw velocity as amplitude, like PrettyMIDI; drum hits already
+# scale by velocity / 127.
+STEM_LEVELS = {'instrument': 1 / 127, 'bass': 1 / 127, 'drums': 1.0}
+
+def normalize_preview(audio, peak=PREVIEW_PEAK):
+    """Scale a stem so its loudest sample sits at `peak`"""
+    max_val = audio.peak() if isinstance(audio, LoopedStem) else np.max(np.abs(audio))
+    if max_val > 0:
+        audio = peak * audio / max_val
+    return audio
+
+def note_spans(note, seconds_per_beat):
+    """(start, end, pitch, velocity) tuples in seconds for one music_data
+    note, one per pitch of a chord"""
+    pitches = [note["pitch"]] if "pitch" in note else note.get("pitches", [])
+    start = note["time"] * seconds_per_beat
+    end = (note["time"] + note["duration"]) * seconds_per_beat
+    velocity = int(note.get("velocity", 100))
+    return [(start, end, int(pitch), velocity) for pitch in pitches]
+
+def track_notes(music_data, track):
+    """Every note span of one track of music_data or a NoteTable, chords
+    flattened"""
+    return as_note_table(music_data).spans(track)
+
+# One synth per process, so pool workers keep their note caches between jobs
+NOTE_SYNTH = WavetableSynth()
+
+def render_stem(music_data, name, synth=None, sample_rate=SAMPLE_RATE):
+    """Render one stem of music_data or a NoteTable; picklable entry point
+    for worker pools"""
+    table = as_note_table(music_data)
+    if name == 'drums':
+        end_time = table.offsets('drums').max(initial=0)
+        return render_drum_hits(
+            table.onsets('drums'),
+            table.tracks['drums']['pitch'],
+            int(end_time * sample_rate) + sample_rate,
+            table.tracks['drums']['velocity'],
+            sample_rate=sample_rate
+        )
+
+    synth = NOTE_SYNTH if synth is None else synth
+    return synth.render_notes(table.spans(name), table.programs[name])
+
+def render_stems(music_data, synth=None, sample_rate=SAMPLE_RATE):
+    """Render instrument, bass and drum audio straight from music_data.
+
+    Produces the same stems as writing the MIDI files and synthesizing
+    them back, without touching disk.
+    """
+    table = as_note_table(music_data)
+    return {
+        name: render_stem(table, name, synth, sample_rate)
+        for name in STEM_NAMES
+    }
+
+def loop_samples(music_data, sample_rate=SAMPLE_RATE):
+    """Length of one loop pass in samples"""
+    table = as_note_table(music_data)
+    return int(round(table.loop_beats * table.seconds_per_beat * sample_rate))
+
+class LoopedStem:
+    """One rendered pass of a stem, played `repeats` times and tiled on read.
+
+    `audio` is a single pass whose note tails may run past `loop_length`
+    samples. Those tails are wrapped onto the start of the following pass,
+    so reads match rendering every pass separately. With `seamless` the
+    stem is exactly `repeats` passes long and the first pass also carries
+    the wrapped tails, so it loops without a gap; otherwise the first pass
+    starts clean and the last tail rings out.
+
+    Only the pass is held, folded into `loop_length` rows. Slicing returns
+    the tiled samples of that range as an array, so code that reads stems
+    block by block takes a LoopedStem wherever it takes an array.
+    """
+
+    def __init__(self, audio, loop_length, repeats, seamless=False):
+        audio = np.asarray(audio)
+        folds = max(1, -(-len(audio) // loop_length))
+        self.chunks = np.zeros((folds, loop_length), dtype=audio.dtype)
+        self.chunks.flat[:len(audio)] = audio
+        self.loop_length = loop_length
+        self.repeats = repeats
+        self.seamless = seamless
+        if seamless:
+            self.length = repeats * loop_length
+        else:
+            self.length = (repeats - 1) * loop_length + max(len(audio), loop_length)
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def dtype(self):
+        return self.chunks.dtype
+
+    @property
+    def nbytes(self):
+        return self.chunks.nbytes
+
+    def _folds(self, index):
+        """Rows of `chunks` sounding in pass `index`"""
+        if self.seamless:
+            return 0, len(self.chunks)
+        return max(0, index - self.repeats + 1), min(len(self.chunks), index + 1)
+
+    def read(self, start, stop):
+        """Tiled samples [start, stop), clipped to the stem length"""
+        stop = min(stop, self.length)
+        out = np.zeros(max(stop - start, 0), dtype=self.dtype)
+        position = start
+        while position < stop:
+            index, offset = divmod(position, self.loop_length)
+            end = min(stop - position, self.loop_length - offset)
+            first, last = self._folds(index)
+            out[position - start:position - start + end] = \
+                self.chunks[first:last, offset:offset + end].sum(axis=0)
+            position += end
+        return out
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            raise TypeError("LoopedStem only supports contiguous slices")
+        start, stop, _ = key.indices(self.length)
+        return self.read(start, stop)
+
+    def peak(self):
+        """Largest absolute sample, from the distinct passes only"""
+        passes = -(-self.length // self.loop_length)
+        rows = {self._folds(index) for index in range(passes)}
+        return max(float(np.max(np.abs(self.chunks[first:last].sum(axis=0)))) for first, last in rows)
+
+    def _with_chunks(self, chunks):
+        stem = copy.copy(self)
+        stem.chunks = chunks
+        return stem
+
+    def astype(self, dtype):
+        return self if self.dtype == dtype else self._with_chunks(self.chunks.astype(dtype))
+
+    def __mul__(self, gain):
+        return self._with_chunks(self.chunks * gain)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, divisor):
+        return self._with_chunks(self.chunks / divisor)
+
+def tile_loop(audio, loop_length, repeats, seamless=False):
+    """Repeat one rendered pass `repeats` times without re-synthesizing;
+    the whole of LoopedStem(audio, loop_length, repeats, seamless) as one
+    array"""
+    return LoopedStem(audio, loop_length, repeats, seamless)[:]
+
+def render_loop_stems(music_data, repeats, synth=None, seamless=False,
+                      sample_rate=SAMPLE_RATE):
+    """Render one pass of every stem and tile it `repeats` times"""
+    length = loop_samples(music_data, sample_rate)
+    return {
+        name: tile_loop(audio, length, repeats, seamless)
+        for name, audio in render_stems(music_data, synth, sample_rate).items()
+    }
+
+def midi_stem_instruments(midi, names=STEM_NAMES):
+    """Group the instruments of a PrettyMIDI object by stem.
+
+    Multitrack files name each track after its stem. A single-stem file
+    has no track names, so everything in it belongs to the one stem asked
+    for.
+    """
+    if len(names) == 1:
+        return {names[0]: list(midi.instruments)}
+    return {
+        name: [inst for inst in midi.instruments if inst.name == name]
+        for name in names
+    }
+
+def render_midi_stems(midi, names=STEM_NAMES, synth=None, sample_rate=SAMPLE_RATE):
+    """Render stems from an already parsed MIDI file of either layout"""
+    synth = NOTE_SYNTH if synth is None else synth
+    stems = {}
+    for name, instruments in midi_stem_instruments(midi, names).items():
+        notes = [note for inst in instruments for note in inst.notes]
+        end_time = max((note.end for note in notes), default=0)
+        if name == 'drums':
+            stems[name] = render_drum_hits(
+                np.array([note.start for note in notes]),
+                np.array([note.pitch for note in notes], dtype=np.intp),
+                int(end_time * sample_rate) + sample_rate,
+                np.array([note.velocity for note in notes]),
+                sample_rate=sample_rate
+            )
+            continue
+
+        audio = np.zeros(int(sample_rate * (end_time + 1)))
+        for inst in instruments:
+            spans = [(note.start, note.end, note.pitch, note.velocity)
+                     for note in inst.notes]
+            synth.render_notes(spans, inst.program, out=audio)
+        stems[name] = audio
+    return stems
+
+# Samples per block yielded by stream_stem
+STREAM_BLOCK_SIZE = 8192
+
+def _stem_voices(music_data, name, synth, sample_rate):
+    """Stem length plus (start sample, waveform getter) per note, in onset
+    order. Waveforms are only built once the stream reaches each note."""
+    fs = sample_rate
+    table = as_note_table(music_data)
+    spans = sorted(table.spans(name))
+    end_time = max((span[1] for span in spans), default=0)
+
+    if name == 'drums':
+        bank = get_drum_bank(fs)
+        length = int(end_time * fs) + fs
+        rows, gains = bank.lookup([span[2] for span in spans], [span[3] for span in spans])
+        voices = [
+            (int(start * fs), lambda row=row, gain=gain: gain * bank.sample(row))
+            for (start, _, _, _), row, gain in zip(spans, rows.tolist(), gains.tolist())
+        ]
+        return length, voices
+
+    program = table.programs[name]
+    length = int(fs * (end_time + 1))
+    voices = [
+        (int(fs * start),
+         lambda start=start, end=end, pitch=pitch, velocity=velocity:
+             synth.note_waveform(program, pitch, max(int(fs * end) - int(fs * start), 0), velocity))
+        for start, end, pitch, velocity in spans
+    ]
+    return length, voices
+
+def stream_stem(music_data, name, block_size=STREAM_BLOCK_SIZE, synth=None,
+                sample_rate=SAMPLE_RATE):
+    """Yield one stem of music_data as consecutive `block_size` blocks.
+
+    Concatenated, the blocks equal render_stem's output. Notes that cross
+    a block boundary carry over into the following blocks, so memory stays
+    at one block plus the waveforms of the notes sounding in it.
+    """
+    synth = NOTE_SYNTH if synth is None else synth
+    length, voices = _stem_voices(music_data, name, synth, sample_rate)
+
+    active = []
+    next_voice = 0
+    for block_start in range(0, length, block_size):
+        block_end = min(block_start + block_size, length)
+        block = np.zeros(block_end - block_start)
+
+        while next_voice < len(voices) and voices[next_voice][0] < block_end:
+            start, waveform = voices[next_voice]
+            next_voice += 1
+            if start >= 0:
+                active.append((start, waveform()))
+
+        sounding = []
+        for start, waveform in active:
+            lo = max(start, block_start)
+            hi = min(start + len(waveform), block_end)
+            if hi > lo:
+                block[lo - block_start:hi - block_start] += waveform[lo - start:hi - start]
+            if start + len(waveform) > block_end:
+                sounding.append((start, waveform))
+        active = sounding
+        yield block
+
+class StreamingStemRenderer:
+    """Synthesizes notes while a composition is still streaming in.
+
+    Pass `on_note` and `on_field` as the MusicGenerator.stream_music_data
+    callbacks. Notes that arrive before the tempo are held back until it is
+    known. `stems()` returns the same audio as render_stems once the stream
+    has finished; nothing is playable before then, since a later note may
+    land anywhere in the timeline. `first_note_at` only records when the
+    first note was synthesized into the private buffers.
+    """
+
+    def __init__(self, synth=None, sample_rate=SAMPLE_RATE):
+        self.synth = NOTE_SYNTH if synth is None else synth
+        self.sample_rate = sample_rate
+        self.tempo = None
+        self.programs = {'instrument': 0, 'bass': 32}
+        self.first_note_at = None
+        self.notes_rendered = 0
+        self._pending = []
+        self._buffers = {'instrument': np.zeros(0), 'bass': np.zeros(0)}
+        self._end_times = {name: 0.0 for name in STEM_NAMES}
+        self._drum_hits = []
+
+    def on_field(self, key, value):
+        if key == 'tempo':
+            self.tempo = value
+            pending, self._pending = self._pending, []
+            for track, note in pending:
+                self._render(track, note)
+        elif key in ('instrument.program', 'bass.program'):
+            self.programs[key.split('.')[0]] = int(value)
+
+    def on_note(self, track, note):
+        if self.tempo is None:
+            self._pending.append((track, note))
+        else:
+            self._render(track, note)
+
+    def _grow(self, track, length):
+        """Make sure a stem buffer holds at least `length` samples"""
+        buffer = self._buffers[track]
+        if len(buffer) < length:
+            grown = np.zeros(max(length, 2 * len(buffer)))
+            grown[:len(buffer)] = buffer
+            self._buffers[track] = grown
+
+    def _render(self, track, note):
+        fs = self.sample_rate
+        for start_time, end_time, pitch, velocity in note_spans(note, 60.0 / self.tempo):
+            self._end_times[track] = max(self._end_times[track], end_time)
+            if track == 'drums':
+                self._drum_hits.append((start_time, pitch, velocity))
+                continue
+            self._grow(track, int(fs * (end_time + 1)))
+            self.synth.render_notes([(start_time, end_time, pitch, velocity)],
+                                    self.programs[track], out=self._buffers[track])
+
+        self.notes_rendered += 1
+        if self.first_note_at is None:
+            self.first_note_at = time.perf_counter()
+
+    def stems(self):
+        """Finished stem audio, trimmed like render_stems"""
+        if self.tempo is None:
+            self.on_field('tempo', 120)
+
+        fs = self.sample_rate
+        stems = {}
+        for track in ('instrument', 'bass'):
+            length = int(fs * (self._end_times[track] + 1))
+            self._grow(track, length)
+            stems[track] = self._buffers[track][:length].copy()
+
+        stems['drums'] = render_drum_hits(
+            [hit[0] for hit in self._drum_hits],
+            [hit[1] for hit in self._drum_hits],
+            int(self._end_times['drums'] * fs) + fs,
+            [hit[2] for hit in self._drum_hits],
+            sample_rate=fs
+        )
+        return stems
@@ -0,0 +1,155 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import soundfile as sf
+from midi_conversion_api import MIDIConverter
+from audio_synthesis_api import SAMPLE_RATE, STEM_NAMES, normalize_preview, render_stems
+from audio_buffers import encode_stem_stream
+from note_table import NoteTable
+
+def parse_document(name, text):
+    """(name, music_data, error) for one document's JSON text; a document
+    that does not parse gets None and the parser's message"""
+    try:
+        return name, json.loads(text), None
+    except ValueError as e:
+        return name, None, f"Invalid JSON: {e}"
+
+def iter_documents(source):
+    """Yield (name, music_data, error) from a directory of .json files or a
+    JSONL file; `error` is None unless the document failed to parse"""
+    if os.path.isdir(source):
+        for filename in sorted(os.listdir(source)):
+            if filename.endswith(".json"):
+                with open(os.path.join(source, filename)) as f:
+                    yield parse_document(os.path.splitext(filename)[0], f.read())
+        return
+
+    stem = os.path.splitext(os.path.basename(source))[0]
+    with open(source) as f:
+        for line_number, line in enumerate(f, 1):
+            if line.strip():
+                yield parse_document(f"{stem}_{line_number:05d}", line)
+
+def convert_document(name, music_data, output_dir, stream=False, multitrack=False):
+    """Write the MIDI and WAV stems for one document; runs in a worker.
+
+    With `stream`, stems are synthesized and written block by block, which
+    bounds memory for long pieces at the cost of synthesizing each stem
+    twice.
+    With `multitrack`, the MIDI goes into one type-1 file instead of one
+    file per stem.
+    """
+    start = time.perf_counter()
+    try:
+        # Validate once; the MIDI writer and every stem read the same table
+        table = NoteTable.from_music_data(music_data)
+        doc_dir = os.path.join(output_dir, name)
+        os.makedirs(doc_dir, exist_ok=True)
+        if multitrack:
+            midi_result = MIDIConverter().convert_to_multitrack_midi(
+                table, output_file=os.path.join(doc_dir, "music.mid")
+            )
+        else:
+            midi_result = MIDIConverter().convert_to_midi(
+                table,
+                instrument_file=os.path.join(doc_dir, "instrument.mid"),
+                bass_file=os.path.join(doc_dir, "bass.mid"),
+                drums_file=os.path.join(doc_dir, "drums.mid")
+            )
+        if midi_result.get("status") != "success":
+            return {"name": name, "status": "error", "message": midi_result["message"]}
+        files = {
+            f"{stem}_midi": path for stem, path in midi_result["output_files"].items()
+        }
+
+        audio_seconds = 0.0
+        if stream:
+            for stem in STEM_NAMES:
+                path = os.path.join(doc_dir, f"{stem}.wav")
+                audio_seconds += encode_stem_stream(table, stem, path, codec='wav')
+                files[f"{stem}_wav"] = path
+        else:
+            for stem, audio in render_stems(table).items():
+                path = os.path.join(doc_dir, f"{stem}.wav")
+                sf.write(path, normalize_preview(audio), SAMPLE_RATE)
+                files[f"{stem}_wav"] = path
+                audio_seconds += len(audio) / SAMPLE_RATE
+
+        return {
+            "name": name,
+            "status": "success",
+            "files": files,
+            "audio_seconds": audio_seconds,
+            "elapsed": time.perf_counter() - start
+        }
+    except Exception as e:
+        return {"name": name, "status": "error", "message": str(e)}
+
+def convert_batch(source, output_dir, workers=None, stream=False, multitrack=False):
+    """Convert every document in `source` across a process pool.
+
+    Yields each worker result as soon as it finishes. At most two documents
+    per worker are queued, so large JSONL files are never fully loaded.
+    """
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(output_dir, exist_ok=True)
+    documents = iter_documents(source)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for name, music_data, error in documents:
+            if error is not None:
+                # Reported like a failed conversion; the rest still run
+                yield {"name": name, "status": "error", "message": error}
+                continue
+            pending.add(pool.submit(convert_document, name, music_data, output_dir,
+                                     stream, multitrack))
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert music_data JSON documents to MIDI and WAV stems"
+    )
+    parser.add_argument("source", help="directory of .json files or a .jsonl file")
+    parser.add_argument("-o", "--output", default="batch_output",
+                        help="output directory (default: batch_output)")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="worker processes (default: CPU count)")
+    parser.add_argument("--stream", action="store_true",
+                        help="render WAVs block by block to bound memory on long pieces")
+    parser.add_argument("--multitrack", action="store_true",
+                        help="write one type-1 MIDI file per document instead of one per stem")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    converted = failed = 0
+    audio_seconds = 0.0
+    for result in convert_batch(args.source, args.output, args.workers,
+                                args.stream, args.multitrack):
+        if result["status"] == "success":
+            converted += 1
+            audio_seconds += result["audio_seconds"]
+            print(f"ok    {result['name']} ({result['elapsed']:.2f}s)", flush=True)
+        else:
+            failed += 1
+            print(f"error {result['name']}: {result['message']}", flush=True)
+
+    wall = time.perf_counter() - start
+    print(f"\n{converted} converted, {failed} failed in {wall:.2f}s")
+    if wall > 0:
+        print(f"{converted / wall:.2f} documents/s, "
+              f"{audio_seconds / wall:.1f} stem audio-seconds per wall-second")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import json
+import time
+import openai
+from fake_openai_server import start_fake_server
+from music_generation_api import MusicGenerator, SYSTEM_PROMPT
+
+GENERATIONS = 20
+# Injected per-request delay, so connection reuse is not the only cost
+LATENCY = 0.02
+ERROR_RATE = 0.3
+
+def fresh_client_generation(base_url, prompt):
+    """What every click did before: a new client, SDK default retries"""
+    client = openai.OpenAI(api_key="xxxxx", base_url=base_url)
+    try:
+        response = client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[{"role": "system", "content": SYSTEM_PROMPT},
+                      {"role": "user", "content": prompt}],
+            response_format={"type": "json_object"}
+        )
+        json.loads(response.choices[0].message.content)
+        return {"status": "success"}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+    finally:
+        client.close()
+
+def run_scenario(generate, server, generations):
+    """Successes, connections opened and mean seconds per generation"""
+    connections = server.connections
+    requests = len(server.requests)
+    successes = 0
+    start = time.perf_counter()
+    for i in range(generations):
+        if generate(f"benchmark {i}")["status"] == "success":
+            successes += 1
+    return {
+        "successes": successes,
+        "generations": generations,
+        "http_requests": len(server.requests) - requests,
+        "connections": server.connections - connections,
+        "mean_s": (time.perf_counter() - start) / generations
+    }
+
+def run_benchmark(generations=GENERATIONS, latency=LATENCY, error_rate=ERROR_RATE, seed=0):
+    server, base_url = start_fake_server(latency=latency, seed=seed)
+    try:
+        generator = MusicGenerator(api_key="benchmark", base_url=base_url)
+        results = {}
+        for label, rate in (("clean", 0.0), ("faulty", error_rate)):
+            server.error_rate = rate
+            results[f"{label}_fresh_client"] = run_scenario(
+                lambda prompt: fresh_client_generation(base_url, prompt), server, generations
+            )
+            results[f"{label}_shared_client"] = run_scenario(
+                generator.generate_music_data, server, generations
+            )
+        server.error_rate = 0.0
+
+        # A reply slower than the whole budget must fail at the deadline,
+        # not after the read timeout
+        server.latency = 2.0
+        impatient = MusicGenerator(api_key="benchmark", base_url=base_url, deadline=0.5)
+        start = time.perf_counter()
+        result = impatient.generate_music_data("deadline")
+        results["deadline"] = {
+            "deadline_s": impatient.deadline,
+            "returned_after_s": time.perf_counter() - start,
+            "status": result["status"],
+            "message": result.get("message")
+        }
+        results["generator_stats"] = generator.stats()
+        return results
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    results = run_benchmark()
+    print(f"{'scenario':<22} {'ok':>7} {'requests':>9} {'connections':>12} {'mean (ms)':>10}")
+    for name, row in results.items():
+        if "successes" in row:
+            print(f"{name:<22} {row['successes']:>3}/{row['generations']:<3} "
+                  f"{row['http_requests']:>9} {row['connections']:>12} {row['mean_s'] * 1000:>10.1f}")
+    deadline = results["deadline"]
+    print(f"deadline {deadline['deadline_s']}s: {deadline['status']} after "
+          f"{deadline['returned_after_s']:.2f}s ({deadline['message']})")
+    print(f"shared generator: {results['generator_stats']}")
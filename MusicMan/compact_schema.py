@@ -0,0 +1,56 @@
+from streaming_json_parser import TRACK_NAMES
+
+# Velocity of a compact note that leaves it out
+DEFAULT_VELOCITY = 100
+
+def decode_note(raw, default_velocity=DEFAULT_VELOCITY):
+    """A music_data note dict from a compact [time, duration, pitch,
+    velocity] array; pitch may be a list of chord pitches"""
+    if not isinstance(raw, list) or not 3 <= len(raw) <= 4:
+        raise ValueError(f"Compact note must be [time, duration, pitch, velocity?], got {raw!r}")
+    note = {
+        "time": raw[0],
+        "duration": raw[1],
+        "velocity": raw[3] if len(raw) == 4 else default_velocity
+    }
+    note["pitches" if isinstance(raw[2], list) else "pitch"] = raw[2]
+    return note
+
+def encode_note(note, default_velocity=DEFAULT_VELOCITY):
+    """The compact array for a music_data note dict"""
+    pitch = note["pitches"] if "pitches" in note else note["pitch"]
+    raw = [note["time"], note["duration"], pitch]
+    velocity = note.get("velocity", default_velocity)
+    if velocity != default_velocity:
+        raw.append(velocity)
+    return raw
+
+def decode_compact(data, default_velocity=DEFAULT_VELOCITY):
+    """music_data from a parsed compact document.
+
+    Top-level fields and track fields other than `notes` are copied as
+    they are, so the result is what the verbose schema would have given.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Compact composition must be a JSON object")
+    music_data = dict(data)
+    for name in TRACK_NAMES:
+        track = data.get(name)
+        if not isinstance(track, dict):
+            continue
+        music_data[name] = dict(track)
+        music_data[name]["notes"] = [
+            decode_note(raw, default_velocity) for raw in track.get("notes", [])
+        ]
+    return music_data
+
+def encode_compact(music_data, default_velocity=DEFAULT_VELOCITY):
+    """The compact document for music_data; decode_compact reverses it"""
+    data = dict(music_data)
+    for name in TRACK_NAMES:
+        if name in music_data:
+            data[name] = dict(music_data[name])
+            data[name]["notes"] = [
+                encode_note(note, default_velocity) for note in music_data[name]["notes"]
+            ]
+    return data
@@ -0,0 +1,220 @@
+import os
+import numpy as np
+
+# Bump when the recipes change so stale caches are rebuilt
+BANK_VERSION = 1
+BANK_DIR = os.path.join(os.path.expanduser("~"), ".cache", "musicman")
+
+# Velocity each layer is recorded at; a hit plays the softest layer at or
+# above its velocity, scaled down to match
+VELOCITY_LAYERS = (32, 64, 96, 127)
+
+# Played for pitches outside the General MIDI percussion range
+FALLBACK_PITCH = 42
+
+# Inharmonic partial ratios for cymbals, hats and bells
+METAL_RATIOS = (1.0, 1.48, 1.93, 2.68, 3.41, 4.53)
+
+# General MIDI percussion, pitch -> (name, seconds, gain, parts).
+# Parts: "tones" [(start Hz, end Hz, sweep s, decay s, level)], "noise"
+# (decay s, level, color), "metal" (base Hz, decay s, level) and "repeat"
+# (count, spacing s, falloff) for claps, scrapes and rattles.
+GM_DRUMS = {
+    35: ("Acoustic Bass Drum", 0.5, 1.0, {"tones": [(80, 45, 0.04, 0.2, 1.0)], "noise": (0.01, 0.15, "low")}),
+    36: ("Bass Drum 1", 0.45, 1.0, {"tones": [(110, 50, 0.03, 0.16, 1.0)], "noise": (0.008, 0.2, "mid")}),
+    37: ("Side Stick", 0.12, 0.6, {"tones": [(1600, 1400, 0.01, 0.015, 0.5)], "noise": (0.01, 0.6, "high")}),
+    38: ("Acoustic Snare", 0.3, 0.9, {"tones": [(220, 180, 0.02, 0.06, 0.5)], "noise": (0.07, 0.8, "mid")}),
+    39: ("Hand Clap", 0.3, 0.8, {"noise": (0.05, 0.9, "mid"), "repeat": (3, 0.011, 0.8)}),
+    40: ("Electric Snare", 0.28, 0.9, {"tones": [(250, 200, 0.01, 0.05, 0.4)], "noise": (0.06, 0.9, "high")}),
+    41: ("Low Floor Tom", 0.5, 0.8, {"tones": [(100, 80, 0.05, 0.25, 1.0)], "noise": (0.02, 0.1, "low")}),
+    42: ("Closed Hi-Hat", 0.12, 0.4, {"metal": (420, 0.03, 0.4), "noise": (0.025, 0.6, "high")}),
+    43: ("High Floor Tom", 0.45, 0.8, {"tones": [(120, 95, 0.05, 0.22, 1.0)], "noise": (0.02, 0.1, "low")}),
+    44: ("Pedal Hi-Hat", 0.15, 0.35, {"metal": (400, 0.045, 0.35), "noise": (0.035, 0.45, "high")}),
+    45: ("Low Tom", 0.4, 0.8, {"tones": [(145, 115, 0.04, 0.2, 1.0)], "noise": (0.02, 0.1, "low")}),
+    46: ("Open Hi-Hat", 0.6, 0.4, {"metal": (420, 0.25, 0.4), "noise": (0.25, 0.6, "high")}),
+    47: ("Low-Mid Tom", 0.4, 0.8, {"tones": [(170, 135, 0.04, 0.18, 1.0)], "noise": (0.02, 0.1, "low")}),
+    48: ("Hi-Mid Tom", 0.35, 0.8, {"tones": [(200, 160, 0.03, 0.16, 1.0)], "noise": (0.02, 0.1, "mid")}),
+    49: ("Crash Cymbal 1", 1.2, 0.5, {"metal": (340, 0.6, 0.5), "noise": (0.5, 0.6, "high")}),
+    50: ("High Tom", 0.35, 0.8, {"tones": [(235, 190, 0.03, 0.15, 1.0)], "noise": (0.02, 0.1, "mid")}),
+    51: ("Ride Cymbal 1", 1.0, 0.45, {"metal": (520, 0.45, 0.5), "noise": (0.3, 0.25, "high")}),
+    52: ("Chinese Cymbal", 1.0, 0.5, {"metal": (290, 0.5, 0.6), "noise": (0.4, 0.6, "mid")}),
+    53: ("Ride Bell", 0.8, 0.45, {"metal": (780, 0.4, 0.7), "tones": [(1560, 1560, 1, 0.3, 0.3)]}),
+    54: ("Tambourine", 0.3, 0.45, {"metal": (2900, 0.06, 0.3), "noise": (0.08, 0.5, "high"), "repeat": (2, 0.02, 0.6)}),
+    55: ("Splash Cymbal", 0.6, 0.45, {"metal": (600, 0.25, 0.5), "noise": (0.2, 0.6, "high")}),
+    56: ("Cowbell", 0.3, 0.5, {"tones": [(800, 800, 1, 0.08, 0.6), (540, 540, 1, 0.1, 0.5)]}),
+    57: ("Crash Cymbal 2", 1.2, 0.5, {"metal": (380, 0.55, 0.5), "noise": (0.45, 0.6, "high")}),
+    58: ("Vibraslap", 0.8, 0.4, {"noise": (0.015, 0.7, "mid"), "tones": [(180, 180, 1, 0.02, 0.4)], "repeat": (16, 0.045, 0.85)}),
+    59: ("Ride Cymbal 2", 1.0, 0.45, {"metal": (480, 0.5, 0.5), "noise": (0.3, 0.25, "high")}),
+    60: ("Hi Bongo", 0.2, 0.7, {"tones": [(480, 400, 0.01, 0.07, 0.9)], "noise": (0.01, 0.2, "mid")}),
+    61: ("Low Bongo", 0.25, 0.7, {"tones": [(340, 290, 0.01, 0.09, 0.9)], "noise": (0.01, 0.2, "mid")}),
+    62: ("Mute Hi Conga", 0.15, 0.7, {"tones": [(350, 320, 0.01, 0.04, 0.9)], "noise": (0.01, 0.2, "mid")}),
+    63: ("Open Hi Conga", 0.35, 0.7, {"tones": [(330, 300, 0.02, 0.15, 0.9)], "noise": (0.01, 0.15, "mid")}),
+    64: ("Low Conga", 0.4, 0.7, {"tones": [(230, 200, 0.02, 0.18, 0.9)], "noise": (0.01, 0.15, "low")}),
+    65: ("High Timbale", 0.35, 0.6, {"tones": [(520, 480, 0.01, 0.12, 0.7)], "noise": (0.05, 0.3, "high")}),
+    66: ("Low Timbale", 0.4, 0.6, {"tones": [(380, 350, 0.01, 0.15, 0.7)], "noise": (0.05, 0.3, "high")}),
+    67: ("High Agogo", 0.35, 0.5, {"tones": [(980, 980, 1, 0.15, 0.6), (2650, 2650, 1, 0.05, 0.2)]}),
+    68: ("Low Agogo", 0.4, 0.5, {"tones": [(700, 700, 1, 0.18, 0.6), (1890, 1890, 1, 0.06, 0.2)]}),
+    69: ("Cabasa", 0.15, 0.4, {"noise": (0.04, 0.7, "high")}),
+    70: ("Maracas", 0.1, 0.4, {"noise": (0.025, 0.7, "high")}),
+    71: ("Short Whistle", 0.15, 0.35, {"tones": [(2500, 2450, 1, 0.2, 0.5)]}),
+    72: ("Long Whistle", 0.5, 0.35, {"tones": [(2300, 2250, 1, 1.0, 0.5)]}),
+    73: ("Short Guiro", 0.15, 0.4, {"noise": (0.008, 0.6, "mid"), "repeat": (5, 0.02, 0.95)}),
+    74: ("Long Guiro", 0.4, 0.4, {"noise": (0.008, 0.6, "mid"), "repeat": (14, 0.022, 0.97)}),
+    75: ("Claves", 0.12, 0.6, {"tones": [(2500, 2500, 1, 0.025, 0.8)]}),
+    76: ("Hi Wood Block", 0.12, 0.6, {"tones": [(1800, 1750, 0.005, 0.03, 0.8)]}),
+    77: ("Low Wood Block", 0.14, 0.6, {"tones": [(1250, 1200, 0.005, 0.035, 0.8)]}),
+    78: ("Mute Cuica", 0.2, 0.5, {"tones": [(500, 900, 0.05, 0.06, 0.7)]}),
+    79: ("Open Cuica", 0.4, 0.5, {"tones": [(400, 700, 0.1, 0.15, 0.7)]}),
+    80: ("Mute Triangle", 0.15, 0.35, {"tones": [(4200, 4200, 1, 0.04, 0.4), (6100, 6100, 1, 0.03, 0.2)]}),
+    81: ("Open Triangle", 1.0, 0.35, {"tones": [(4200, 4200, 1, 0.6, 0.4), (6100, 6100, 1, 0.4, 0.2)]}),
+}
+
+GM_DRUM_PITCHES = tuple(sorted(GM_DRUMS))
+
+def _smooth(signal, width):
+    return np.convolve(signal, np.ones(width) / width, mode="same")
+
+def synthesize_drum(pitch, velocity=127, sample_rate=44100):
+    """One deterministic hit of a GM percussion sound at a layer velocity.
+
+    Noise is seeded by pitch, so every layer of a sound shares its noise;
+    softer layers are darker as well as quieter.
+    """
+    _, seconds, gain, parts = GM_DRUMS[pitch]
+    n = int(seconds * sample_rate)
+    t = np.arange(n) / sample_rate
+    rng = np.random.default_rng(pitch)
+    brightness = velocity / 127
+    hit = np.zeros(n)
+
+    for start_hz, end_hz, sweep, decay, level in parts.get("tones", ()):
+        frequency = end_hz + (start_hz - end_hz) * np.exp(-t / sweep)
+        phase = 2 * np.pi * np.cumsum(frequency) / sample_rate
+        hit += level * np.sin(phase) * np.exp(-t / decay)
+
+    if "metal" in parts:
+        base, decay, level = parts["metal"]
+        # Square-ish partials give the clangy spectrum of real cymbals
+        partials = sum(np.sign(np.sin(2 * np.pi * base * ratio * t + ratio))
+                       for ratio in METAL_RATIOS)
+        hit += level * (partials - _smooth(partials, 3)) / len(METAL_RATIOS) * np.exp(-t / decay)
+
+    if "noise" in parts:
+        decay, level, color = parts["noise"]
+        white = rng.uniform(-1, 1, n)
+        if color == "high":
+            white = white - _smooth(white, 4)
+        elif color == "low":
+            white = _smooth(white, 8)
+        noise = brightness * white + (1 - brightness) * _smooth(white, 6)
+        hit += level * noise * np.exp(-t / decay)
+
+    if "repeat" in parts:
+        count, spacing, falloff = parts["repeat"]
+        single, hit = hit, np.zeros(n)
+        for k in range(count):
+            offset = int(k * spacing * sample_rate)
+            if offset < n:
+                hit[offset:] += falloff ** k * single[:n - offset]
+
+    # 5 ms fade-out so the truncated end never clicks
+    fade = min(n, int(0.005 * sample_rate))
+    hit[n - fade:] *= np.linspace(1, 0, fade)
+    peak = np.max(np.abs(hit))
+    if peak > 0:
+        hit *= gain * brightness / peak
+    return hit.astype(np.float32)
+
+def bank_layout(sample_rate=44100):
+    """Row offsets and lengths of every (pitch, layer) sample in the bank"""
+    lengths = np.repeat([int(GM_DRUMS[pitch][1] * sample_rate) for pitch in GM_DRUM_PITCHES],
+                        len(VELOCITY_LAYERS))
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    return offsets, lengths
+
+def build_bank(sample_rate=44100):
+    """Every GM sound at every velocity layer, concatenated"""
+    return np.concatenate([
+        synthesize_drum(pitch, velocity, sample_rate)
+        for pitch in GM_DRUM_PITCHES
+        for velocity in VELOCITY_LAYERS
+    ])
+
+class DrumBank:
+    """General MIDI percussion samples in one flat float32 array.
+
+    Loaded from an .npy cache with memory mapping, so every process that
+    opens the bank shares the same pages. Row r holds one pitch at one
+    velocity layer; `lookup` maps hits to rows and gains.
+    """
+
+    def __init__(self, samples, sample_rate=44100):
+        self.samples = samples
+        self.sample_rate = sample_rate
+        self.offsets, self.lengths = bank_layout(sample_rate)
+        self._pitch_index = np.full(128, GM_DRUM_PITCHES.index(FALLBACK_PITCH), dtype=np.intp)
+        self._pitch_index[list(GM_DRUM_PITCHES)] = np.arange(len(GM_DRUM_PITCHES))
+        self._envelopes = None
+
+    @classmethod
+    def load(cls, sample_rate=44100, cache_dir=BANK_DIR):
+        """Memory-map the cached bank, building and saving it first if needed"""
+        path = os.path.join(cache_dir, f"gm_drums_v{BANK_VERSION}_{sample_rate}.npy")
+        expected = int(bank_layout(sample_rate)[1].sum())
+        try:
+            samples = np.load(path, mmap_mode="r")
+            if samples.shape == (expected,) and samples.dtype == np.float32:
+                return cls(samples, sample_rate)
+        except (OSError, ValueError):
+            pass
+
+        samples = build_bank(sample_rate)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            # Write to a private name, then rename, so concurrent workers
+            # never map a half-written file
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, samples)
+            os.replace(tmp_path, path)
+            samples = np.load(path, mmap_mode="r")
+        except OSError:
+            # Read-only cache location; keep the bank in memory
+            pass
+        return cls(samples, sample_rate)
+
+    def lookup(self, pitches, velocities):
+        """Rows and gains for arrays of MIDI pitches and velocities"""
+        pitches = np.clip(np.asarray(pitches, dtype=np.intp), 0, 127)
+        velocities = np.clip(np.asarray(velocities, dtype=np.float64), 0, 127)
+        layers = np.searchsorted(VELOCITY_LAYERS, velocities)
+        layers = np.minimum(layers, len(VELOCITY_LAYERS) - 1)
+        rows = self._pitch_index[pitches] * len(VELOCITY_LAYERS) + layers
+        gains = velocities / np.asarray(VELOCITY_LAYERS, dtype=np.float64)[layers]
+        return rows, gains
+
+    def sample(self, row):
+        """Read-only view of one row's samples"""
+        offset = self.offsets[row]
+        return self.samples[offset:offset + self.lengths[row]]
+
+    @property
+    def envelopes(self):
+        """Laid out like `samples`: the largest absolute amplitude from each
+        sample to the end of its row, so it never increases along a row"""
+        if self._envelopes is None:
+            envelopes = np.empty(len(self.samples), dtype=np.float32)
+            for offset, length in zip(self.offsets.tolist(), self.lengths.tolist()):
+                tail = np.abs(self.samples[offset:offset + length])[::-1]
+                envelopes[offset:offset + length] = np.maximum.accumulate(tail)[::-1]
+            self._envelopes = envelopes
+        return self._envelopes
+
+    @property
+    def peaks(self):
+        """Peak absolute amplitude of every row"""
+        return self.envelopes[self.offsets]
+
+    @property
+    def max_length(self):
+        return int(self.lengths.max())
@@ -0,0 +1,98 @@
+import time
+import numpy as np
+from audio_synthesis_api import SAMPLE_RATE, get_drum_bank, render_drum_hits
+
+HIT_COUNTS = (100, 10_000, 100_000, 1_000_000)
+TRACK_SECONDS = 60
+GM_DRUM_PITCHES = np.array([35, 36, 38, 40, 42, 44, 46, 49, 51])
+
+def legacy_drum_samples(sample_rate=SAMPLE_RATE):
+    """The three 100 ms samples the app generated before the GM bank"""
+    duration = 0.1
+    t = np.linspace(0, duration, int(duration * sample_rate))
+    return {
+        'kick': 0.5 * np.sin(2 * np.pi * 50 * t) * np.exp(-10 * t),
+        'snare': np.random.uniform(-1, 1, len(t)) * np.exp(-15 * t),
+        'hihat': 0.3 * np.sin(2 * np.pi * 8000 * t) * np.exp(-50 * t)
+    }
+
+LEGACY_DRUM_SAMPLES = legacy_drum_samples()
+
+def legacy_drum_loop(onsets, pitches, length):
+    """The per-note loop enhance_drum_track used before render_drum_hits"""
+    audio = np.zeros(length)
+    sample_len = len(LEGACY_DRUM_SAMPLES['kick'])
+
+    for onset, pitch in zip(onsets, pitches):
+        start = int(onset * SAMPLE_RATE)
+        end = start + sample_len
+
+        if pitch == 36:
+            sample = LEGACY_DRUM_SAMPLES['kick']
+        elif pitch == 38 or pitch == 40:
+            sample = LEGACY_DRUM_SAMPLES['snare']
+        else:
+            sample = LEGACY_DRUM_SAMPLES['hihat']
+
+        if end <= len(audio):
+            audio[start:end] += sample[:end-start]
+
+    return audio
+
+def reference_mix(onsets, pitches, length):
+    """One slice add per hit from the GM bank, the baseline render_drum_hits
+    is timed against and checked with"""
+    bank = get_drum_bank(SAMPLE_RATE)
+    audio = np.zeros(length)
+    rows, gains = bank.lookup(pitches, np.full(len(pitches), 100))
+    for onset, row, gain in zip(onsets, rows.tolist(), gains.tolist()):
+        start = int(onset * SAMPLE_RATE)
+        sample = bank.sample(row).astype(np.float64)
+        end = min(start + len(sample), length)
+        audio[start:end] += gain * sample[:end - start]
+    return audio
+
+def random_hits(count, seconds, seed=0):
+    """Uniformly scattered drum hits over `seconds` of audio"""
+    rng = np.random.default_rng(seed)
+    onsets = np.sort(rng.uniform(0, seconds, count))
+    pitches = rng.choice(GM_DRUM_PITCHES, count)
+    return onsets, pitches
+
+def time_call(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def run_benchmark(hit_counts=HIT_COUNTS, seconds=TRACK_SECONDS):
+    """render_drum_hits vs a per-hit loop over the same GM bank samples.
+
+    `speedup` is against that loop. The legacy loop is timed for
+    reference only: it mixes three 100 ms samples where the bank has
+    samples of up to 1.2 s, so it does less work.
+    """
+    length = seconds * SAMPLE_RATE
+    # Map the bank and fault its pages in before anything is timed
+    render_drum_hits(*random_hits(len(GM_DRUM_PITCHES), 1), SAMPLE_RATE)
+    rows = []
+    for count in hit_counts:
+        onsets, pitches = random_hits(count, seconds)
+        _, legacy_time = time_call(legacy_drum_loop, onsets, pitches, length)
+        reference, reference_time = time_call(reference_mix, onsets, pitches, length)
+        batched, batched_time = time_call(render_drum_hits, onsets, pitches, length)
+        rows.append({
+            "hits": count,
+            "legacy_s": legacy_time,
+            "per_hit_s": reference_time,
+            "batched_s": batched_time,
+            "speedup": reference_time / batched_time,
+            "max_abs_diff": float(np.max(np.abs(reference - batched)))
+        })
+    return rows
+
+if __name__ == "__main__":
+    print(f"{'hits':>10} {'legacy (s)':>12} {'per hit (s)':>12} {'batched (s)':>12} "
+          f"{'speedup':>9} {'max diff':>10}")
+    for row in run_benchmark():
+        print(f"{row['hits']:>10} {row['legacy_s']:>12.4f} {row['per_hit_s']:>12.4f} "
+              f"{row['batched_s']:>12.4f} {row['speedup']:>8.1f}x {row['max_abs_diff']:>10.2e}")
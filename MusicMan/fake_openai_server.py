@@ -0,0 +1,204 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Small but complete composition returned by default
+CANNED_MUSIC_DATA = {
+    "tempo": 120,
+    "time_signature": "4/4",
+    "total_beats": 40,
+    "instrument": {
+        "program": 0,
+        "notes": [
+            {"pitches": [60, 64, 67], "time": beat, "duration": 2, "velocity": 90}
+            if beat % 8 == 0 else
+            {"pitch": 64 + beat % 5, "time": beat, "duration": 1, "velocity": 100}
+            for beat in range(40)
+        ]
+    },
+    "bass": {
+        "program": 33,
+        "notes": [
+            {"pitch": 36 + (beat // 8) % 3, "time": beat, "duration": 1, "velocity": 110}
+            for beat in range(0, 40, 2)
+        ]
+    },
+    "drums": {
+        "notes": [
+            {"pitch": (36, 42, 38, 42)[step % 4], "time": step / 2, "duration": 1, "velocity": 100}
+            for step in range(80)
+        ]
+    }
+}
+
+class FakeCompletionsHandler(BaseHTTPRequestHandler):
+    """Answers POST .../chat/completions with the server's canned content.
+
+    Streaming requests get the content as server-sent events of
+    `chunk_size` characters, `chunk_delay` seconds apart. Blocking requests
+    wait for the same total time, so both modes see the same token rate.
+    Blocking responses keep the connection alive; streams close it.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        # One handler per TCP connection
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        self.server.requests.append(request)
+
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+
+        latency = self.server.latency
+        if self.server.latency_jitter:
+            latency += self.server.random.uniform(0, self.server.latency_jitter)
+        if latency:
+            time.sleep(latency)
+
+        fault = self._next_fault()
+        if fault == "drop":
+            # Hang up without answering, like a reset connection
+            self.close_connection = True
+            return
+        if fault is not None:
+            self._send_fault(fault)
+            return
+
+        content = self.server.content
+        size = self.server.chunk_size
+        pieces = [content[i:i + size] for i in range(0, len(content), size)]
+        completion_id = f"chatcmpl-fake-{len(self.server.requests)}"
+        model = request.get("model", "fake")
+
+        if request.get("stream"):
+            try:
+                self._stream(pieces, completion_id, model)
+            except (BrokenPipeError, ConnectionResetError):
+                # Client gave up mid-stream, e.g. at its deadline
+                pass
+            return
+
+        time.sleep(self.server.chunk_delay * len(pieces))
+        body = json.dumps({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _next_fault(self):
+        """Scripted fault for this request, then a random 503 at `error_rate`"""
+        with self.server.lock:
+            if self.server.errors:
+                return self.server.errors.pop(0)
+            if self.server.random.random() < self.server.error_rate:
+                return 503
+        return None
+
+    def _send_fault(self, status):
+        body = json.dumps({
+            "error": {"message": f"Injected error {status}", "type": "server_error", "code": None}
+        }).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, pieces, completion_id, model):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        # No length up front, so the end of the body is the end of the connection
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        deltas = [{"role": "assistant", "content": ""}]
+        deltas += [{"content": piece} for piece in pieces]
+        for index, delta in enumerate(deltas):
+            last = index == len(deltas) - 1
+            event = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "delta": delta,
+                    "finish_reason": "stop" if last else None
+                }]
+            }
+            if index and self.server.chunk_delay:
+                time.sleep(self.server.chunk_delay)
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+def start_fake_server(content=None, latency=0.0, chunk_size=16, chunk_delay=0.0,
+                      host="127.0.0.1", port=0, latency_jitter=0.0, errors=(),
+                      error_rate=0.0, seed=0):
+    """Serve canned chat completions on a background thread.
+
+    Returns the server and the base_url to hand to MusicGenerator. Every
+    request body is recorded in `server.requests` and every accepted TCP
+    connection counted in `server.connections`; call `server.shutdown()`
+    when done.
+
+    Faults for testing retries: each request first waits `latency` plus up
+    to `latency_jitter` seconds. The next requests then fail as listed in
+    `errors`, HTTP status codes or "drop" to hang up without a response.
+    After that a request fails with 503 at probability `error_rate`.
+    `errors` and `error_rate` can be changed on the running server.
+    """
+    server = ThreadingHTTPServer((host, port), FakeCompletionsHandler)
+    server.daemon_threads = True
+    server.content = json.dumps(CANNED_MUSIC_DATA) if content is None else content
+    server.latency = latency
+    server.latency_jitter = latency_jitter
+    server.chunk_size = chunk_size
+    server.chunk_delay = chunk_delay
+    server.errors = list(errors)
+    server.error_rate = error_rate
+    server.random = random.Random(seed)
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+if __name__ == "__main__":
+    server, base_url = start_fake_server(port=8765)
+    print(f"Fake completions endpoint at {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+class GenerationCache:
+    """On-disk cache of MusicGenerator results, addressed by request content.
+
+    Entries are JSON files named after a SHA-256 of the normalized prompt,
+    model and system prompt. Entries older than `max_age` seconds are
+    dropped, and the least recently used entries go once the directory
+    grows past `max_bytes`.
+    """
+
+    def __init__(self, cache_dir="generation_cache", max_bytes=50 * 1024 * 1024,
+                 max_age=7 * 24 * 3600):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def normalize_prompt(prompt):
+        """Collapse whitespace and case so trivially different prompts share
+        an entry"""
+        return " ".join(prompt.split()).casefold()
+
+    @staticmethod
+    def make_key(prompt, model, system_prompt):
+        payload = json.dumps([
+            GenerationCache.normalize_prompt(prompt), model, system_prompt
+        ])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """Cached value for `key`, or None on a miss or expired entry"""
+        path = self._path(key)
+        try:
+            age = time.time() - os.path.getmtime(path)
+            if age > self.max_age:
+                os.unlink(path)
+                raise FileNotFoundError(path)
+            with open(path) as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        # Refresh mtime so size eviction drops the least recently used
+        os.utime(path)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Store `value` atomically, then enforce the age and size limits"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self.evict(keep=self._path(key))
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        """Drop expired entries, then the oldest ones until under max_bytes.
+        The entry at `keep` is never dropped for size"""
+        now = time.time()
+        entries = []
+        for mtime, size, path in self._entries():
+            if now - mtime > self.max_age:
+                self._remove(path)
+            else:
+                entries.append((mtime, size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def clear(self):
+        for _, _, path in self._entries():
+            self._remove(path)
+
+    def stats(self):
+        """Hit/miss counters and current disk usage"""
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes
+        }
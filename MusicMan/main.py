@@ -1,254 +1,618 @@
 import streamlit as st
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import io
 import os
+import uuid
 import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-import pygame
-import tempfile
-import numpy as np
-from pretty_midi import PrettyMIDI, Instrument
-import soundfile as sf
-from music_generation_api import MusicGenerator
-from midi_conversion_api import MIDIConverter
+from startup_timing import IMPORT_TIMINGS, lazy_import
+from stage_timing import StageRecorder, open_stage_log
+
+# Heavy modules (numpy, pygame, pretty_midi, soundfile, openai and the app
+# modules built on them) are loaded through lazy_import on first use, so
+# the page paints before they load and reruns never pay for them again.
 
 OUTPUT_FOLDER = "generated_music"
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
+# Playback, mixdown and overviews keep one pass per stem and tile it on
+# read; only the encoded previews hold every pass. 32 passes of a
+# 20-second piece is over ten minutes.
+MAX_LOOP_REPEATS = 32
+
+# pygame mixer device buffer in samples
+MIXER_BUFFER = 4096
+# Mixer channels of each session: one per stem for single-stem playback,
+# then the synchronized mix
+SESSION_CHANNELS = 4
+MIX_CHANNEL = 3
+
 def create_timestamped_folder():
     """Create a unique folder for each generation session"""
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    folder_path = os.path.join(OUTPUT_FOLDER, timestamp)
+    # Generations in the same second, from any session, must not share a
+    # folder: its path also keys the cached download payloads
+    folder_path = os.path.join(OUTPUT_FOLDER, f"{timestamp}_{uuid.uuid4().hex[:8]}")
     os.makedirs(folder_path, exist_ok=True)
     return folder_path
 
-# Drum sample generator with fixed lengths
-def generate_drum_samples():
-    """Create properly sized drum samples"""
-    sample_rate = 44100
-    duration = 0.1  # 100ms for all samples
-    samples = {
-        'kick': np.zeros(int(duration * sample_rate)),
-        'snare': np.zeros(int(duration * sample_rate)),
-        'hihat': np.zeros(int(duration * sample_rate))
-    }
-    
-    t = np.linspace(0, duration, len(samples['kick']))
-    
-    # Kick drum (low frequency pulse)
-    samples['kick'] = 0.5 * np.sin(2 * np.pi * 50 * t) * np.exp(-10 * t)
-    
-    # Snare (noise burst)
-    samples['snare'] = np.random.uniform(-1, 1, len(t)) * np.exp(-15 * t)
-    
-    # Hi-hat (high frequency burst)
-    samples['hihat'] = 0.3 * np.sin(2 * np.pi * 8000 * t) * np.exp(-50 * t)
-    
-    return samples
+@st.cache_resource
+def get_generation_cache():
+    """Shared on-disk cache of LLM results, so counters survive reruns"""
+    generation_cache = lazy_import("generation_cache")
+    return generation_cache.GenerationCache(
+        os.path.join(OUTPUT_FOLDER, ".generation_cache")
+    )
+
+@st.cache_resource
+def get_generator(schema="verbose"):
+    """One MusicGenerator per process and output schema, not one per click"""
+    music_generation_api = lazy_import("music_generation_api")
+    return music_generation_api.MusicGenerator(
+        api_key="your-api-key",
+        cache=get_generation_cache(),
+        schema=schema
+    )
 
-DRUM_SAMPLES = generate_drum_samples()
+@st.cache_resource
+def get_mixer():
+    """Initialize pygame's mixer once per process"""
+    pygame = lazy_import("pygame")
+    # Initialize pygame with enough channels
+    pygame.mixer.init(frequency=44100, size=-16, channels=6, buffer=MIXER_BUFFER)
+    return pygame.mixer
+
+@st.cache_resource
+def get_audio_store():
+    """Per-process budget for every session's preview audio"""
+    audio_buffers = lazy_import("audio_buffers")
+    return audio_buffers.AudioBufferStore()
+
+@st.cache_resource
+def get_stem_store():
+    """Per-process budget for every session's raw rendered stems, the
+    source of playback and mixdown"""
+    audio_buffers = lazy_import("audio_buffers")
+    return audio_buffers.AudioBufferStore()
+
+@st.cache_resource
+def get_channel_pool():
+    """Per-process assignment of mixer channels to sessions"""
+    playback_engine = lazy_import("playback_engine")
+    return playback_engine.ChannelPool(SESSION_CHANNELS)
+
+def current_session_id():
+    return get_script_run_ctx().session_id
+
+def session_channel(offset):
+    """Index of mixer channel `offset` in this session's block, assigning
+    the block on first use"""
+    pool = get_channel_pool()
+    release_inactive_sessions(pool)
+    base = pool.acquire(current_session_id())
+    mixer = get_mixer()
+    if mixer.get_num_channels() < pool.size:
+        mixer.set_num_channels(pool.size)
+    return base + offset
+
+@st.cache_resource
+def get_stage_log():
+    """Rotating JSONL log of stage spans, shared by every session"""
+    return open_stage_log(os.path.join(OUTPUT_FOLDER, "stage_timings.jsonl"))
+
+def get_stage_recorder():
+    """This session's StageRecorder, created on first use"""
+    if 'stage_recorder' not in st.session_state:
+        st.session_state.stage_recorder = StageRecorder(
+            current_session_id(), get_stage_log()
+        )
+    return st.session_state.stage_recorder
+
+def show_stage_timings():
+    """Sidebar panel with this session's recent stage spans"""
+    if not st.session_state.get('show_stage_timings'):
+        return
+    recorder = get_stage_recorder()
+    with st.sidebar.expander("🩺 Stage timings", expanded=True):
+        if not recorder.spans:
+            st.write("No stages recorded yet")
+            return
+        st.dataframe(
+            [
+                {
+                    "stage": span["stage"],
+                    "wall (ms)": round(span["wall_s"] * 1000, 1),
+                    "cpu (ms)": round(span["cpu_s"] * 1000, 1),
+                    "process max RSS (MiB)": span["max_rss_mb"]
+                }
+                for span in reversed(recorder.spans)
+            ],
+            hide_index=True
+        )
 
-def enhance_drum_track(midi_path):
-    """Safer drum track enhancement"""
+def apply_playback_controls(engine):
+    """Push this rerun's gain, mute and solo widgets into the engine; the
+    next mixed block picks them up"""
+    for name in engine.stems:
+        engine.set_gain(name, st.session_state.get(f"gain_{name}", 1.0))
+        engine.set_mute(name, st.session_state.get(f"mute_{name}", False))
+        engine.set_solo(name, st.session_state.get(f"solo_{name}", False))
+
+def start_playback(stems, block_size):
+    """Play every stem from one mixed stream, all starting on sample 0"""
+    playback_engine = lazy_import("playback_engine")
+    stop_playback()
+    output = playback_engine.PygameOutput(get_mixer(), session_channel(MIX_CHANNEL), MIXER_BUFFER)
+    engine = playback_engine.PlaybackEngine(stems, output, block_size=block_size)
+    apply_playback_controls(engine)
+    get_channel_pool().attach(current_session_id(), engine)
+    engine.start()
+    st.session_state.playback_engine = engine
+
+def stop_playback():
+    """Stop the session's mixed stream and any single-stem playback; other
+    sessions keep playing"""
+    engine = st.session_state.get('playback_engine')
+    if engine is not None:
+        engine.stop()
+        st.session_state.playback_engine = None
+    base = get_channel_pool().get(current_session_id())
+    if base is not None:
+        mixer = get_mixer()
+        for offset in range(SESSION_CHANNELS):
+            mixer.Channel(base + offset).stop()
+
+def release_inactive_sessions(*stores):
+    """Free preview audio and mixer channels of sessions that have
+    disconnected"""
     try:
-        midi = PrettyMIDI(midi_path)
-        if not midi.instruments:
-            return None
-            
-        # Create output audio buffer
-        end_time = midi.get_end_time()
-        audio = np.zeros(int(end_time * 44100) + 44100)
-        sample_len = len(DRUM_SAMPLES['kick'])
-        
-        for note in midi.instruments[0].notes:
-            start = int(note.start * 44100)
-            end = start + sample_len
-            
-            # Select appropriate sample
-            if note.pitch == 36:  # Kick
-                sample = DRUM_SAMPLES['kick']
-            elif note.pitch == 38 or note.pitch == 40:  # Snare
-                sample = DRUM_SAMPLES['snare']
-            else:  # Hi-hat/cymbal
-                sample = DRUM_SAMPLES['hihat']
-            
-            # Safe mixing
-            if end <= len(audio):
-                audio[start:end] += sample[:end-start]
-        
-        return audio
-    except Exception as e:
-        st.error(f"Drum processing error: {str(e)}")
-        return None
+        runtime = Runtime.instance()
+    except RuntimeError:
+        return
+    for store in stores:
+        store.prune(runtime.is_active_session)
 
-def generate_wav_preview(midi_path, is_drum=False):
-    """More robust WAV generation"""
+@st.cache_resource
+def get_render_pool():
+    """One worker pool per server process, reused across reruns"""
+    synthesis = lazy_import("audio_synthesis_api")
+    # Spawn rather than fork: the Streamlit server is multithreaded
+    return ProcessPoolExecutor(
+        max_workers=len(synthesis.STEM_NAMES),
+        mp_context=multiprocessing.get_context("spawn")
+    )
+
+def render_stems_parallel(note_table):
+    """Render every stem concurrently; failed stems come back as None"""
+    synthesis = lazy_import("audio_synthesis_api")
+    pool = get_render_pool()
+    futures = {
+        name: pool.submit(synthesis.render_stem, note_table, name)
+        for name in synthesis.STEM_NAMES
+    }
+    stems = {}
+    for name, future in futures.items():
+        try:
+            stems[name] = future.result()
+        except BrokenProcessPool as e:
+            # A dead worker poisons the pool; reap its management thread
+            # and remaining workers, and build a fresh one next time
+            pool.shutdown(wait=False, cancel_futures=True)
+            get_render_pool.clear()
+            st.error(f"Audio generation error: {str(e)}")
+            stems[name] = None
+        except Exception as e:
+            st.error(f"Audio generation error: {str(e)}")
+            stems[name] = None
+    return stems
+
+def encode_stem_preview(audio, codec="ogg"):
+    """Normalize a rendered stem into compact in-memory audio bytes"""
+    audio_buffers = lazy_import("audio_buffers")
     try:
-        if is_drum:
-            audio = enhance_drum_track(midi_path)
-        else:
-            midi = PrettyMIDI(midi_path)
-            audio = midi.synthesize(fs=44100)
-        
         if audio is None or len(audio) == 0:
             return None
-            
-        max_val = np.max(np.abs(audio))
-        if max_val > 0:
-            audio = 0.7 * audio / max_val
-        
-        temp_wav = tempfile.NamedTemporaryFile(suffix='.wav', delete=False)
-        sf.write(temp_wav.name, audio, 44100)
-        temp_wav.close()
-        return temp_wav.name
+        return audio_buffers.encode_preview(audio, codec)
         
     except Exception as e:
         st.error(f"Audio generation error: {str(e)}")
         return None
 
+def tile_loop_stems(note_table, stems, repeats, seamless=False):
+    """`repeats` passes of each stem as LoopedStems, which hold the one
+    rendered pass and tile it as they are read"""
+    synthesis = lazy_import("audio_synthesis_api")
+    length = synthesis.loop_samples(note_table)
+    return {
+        name: None if audio is None else synthesis.LoopedStem(audio, length, repeats, seamless)
+        for name, audio in stems.items()
+    }
+
+def mix_stems(stems):
+    """Rendered stems as float32, ready for playback and mixdown, which put
+    them on one level themselves"""
+    return {name: audio.astype("float32") for name, audio in stems.items()}
+
+def build_overviews(stems):
+    """Min/max envelope pyramid of every rendered stem"""
+    waveform_overview = lazy_import("waveform_overview")
+    return {
+        name: waveform_overview.WaveformPyramid.from_audio(audio)
+        for name, audio in stems.items() if audio is not None
+    }
+
+def show_waveform_overviews(overviews):
+    """One chart per stem over a shared zoom range.
+
+    Charts read the pyramid level that fits the range in a bounded number
+    of points, so a long track costs the browser no more than a short one.
+    """
+    if not overviews:
+        return
+    duration = max(pyramid.duration for pyramid in overviews.values())
+    if duration <= 0:
+        return
+    st.subheader("Waveform Overview")
+    start, end = st.slider(
+        "Zoom (seconds)", 0.0, float(duration), (0.0, float(duration)),
+        key="overview_range"
+    )
+    if end <= start:
+        return
+    for name, pyramid in overviews.items():
+        times, mins, maxs = pyramid.view(start, end)
+        # Same scale as the normalized previews
+        scale = 1.0 / pyramid.peak if pyramid.peak else 0.0
+        st.caption(name.capitalize())
+        st.line_chart(
+            {"time (s)": times, "max": maxs * scale, "min": mins * scale},
+            x="time (s)", y=["max", "min"], height=120
+        )
+
+def write_midi_files(note_table, output_folder, layout="stems"):
+    """Write the MIDI for a generation; only needed for downloads.
+
+    `layout` is "stems" for one file per track or "multitrack" for a
+    single type-1 file holding all three.
+    """
+    midi_conversion_api = lazy_import("midi_conversion_api")
+    converter = midi_conversion_api.MIDIConverter()
+    if layout == "multitrack":
+        midi_result = converter.convert_to_multitrack_midi(
+            note_table,
+            output_file=os.path.join(output_folder, 'music.mid')
+        )
+    else:
+        midi_result = converter.convert_to_midi(
+            note_table,
+            instrument_file=os.path.join(output_folder, 'instrument.mid'),
+            bass_file=os.path.join(output_folder, 'bass.mid'),
+            drums_file=os.path.join(output_folder, 'drums.mid')
+        )
+    if midi_result.get("status") != "success":
+        return None
+    return midi_result["output_files"]
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def build_download_payloads(output_folder, layout, _midi_files):
+    """Read the MIDI stems and zip them in memory, once per generation.
+
+    Cached on the generation's output folder and MIDI layout, so later
+    reruns reuse the same bytes without touching disk (and record no span).
+    """
+    with get_stage_recorder().span("download.build_payloads", files=len(_midi_files)):
+        tracks = {}
+        for name, path in _midi_files.items():
+            with open(path, "rb") as f:
+                tracks[name] = f.read()
+
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zipf:
+            for name, path in _midi_files.items():
+                zipf.writestr(os.path.basename(path), tracks[name])
+    return archive.getvalue(), tracks
+
 def main():
     st.title("🎵 AI Music Generator")
     st.markdown("Generate custom music with AI")
 
-    # Initialize pygame with enough channels
-    pygame.mixer.init(frequency=44100, size=-16, channels=6, buffer=4096)
+    with st.sidebar.expander("⏱️ Startup timing"):
+        if IMPORT_TIMINGS:
+            for name, seconds in IMPORT_TIMINGS.items():
+                st.write(f"`{name}`: {seconds * 1000:.0f} ms")
+        else:
+            st.write("No heavy modules loaded yet")
+
+    # Same keys as audio_buffers.CODECS, listed here to keep first paint light
+    preview_codec = st.sidebar.selectbox(
+        "Preview format", ["ogg", "flac", "wav"], format_func=str.upper
+    )
+    download_codec = st.sidebar.selectbox(
+        "Audio download format", ["flac", "ogg", "wav"], format_func=str.upper
+    )
+    midi_layout = st.sidebar.radio(
+        "MIDI download", ["stems", "multitrack"],
+        format_func={"stems": "Separate track files", "multitrack": "Single multitrack file"}.get
+    )
+    # Same keys as music_generation_api.SCHEMAS
+    output_schema = st.sidebar.radio(
+        "Model output format", ["verbose", "compact"],
+        format_func={"verbose": "Note objects", "compact": "Compact arrays (fewer tokens)"}.get
+    )
+    loop_repeats = st.sidebar.number_input("Loop repetitions", 1, MAX_LOOP_REPEATS, 1)
+    seamless_loop = st.sidebar.checkbox(
+        "Seamless loop", help="Wrap the last note tails onto the start instead of ringing out"
+    )
+    if "audio_buffers" in IMPORT_TIMINGS:
+        with st.sidebar.expander("📦 Encoding stats"):
+            for codec, stats in lazy_import("audio_buffers").codec_stats().items():
+                if stats["files"]:
+                    st.write(
+                        f"**{codec.upper()}**: {stats['files']} files, "
+                        f"{stats['bytes'] / 1024:.0f} KiB "
+                        f"({stats['ratio']:.0%} of PCM), "
+                        f"{stats['encode_seconds'] * 1000:.0f} ms encoding"
+                    )
+
+    playback_block = st.sidebar.select_slider(
+        "Playback block (samples)", [512, 1024, 2048, 4096, 8192], 2048,
+        help="Smaller blocks apply mute, solo and gain changes sooner"
+    )
+    st.sidebar.checkbox("Show stage timings", key="show_stage_timings")
 
     # Session state
     if 'generated' not in st.session_state:
         st.session_state.update({
             'generated': False,
+            'note_table': None,
+            'output_folder': None,
             'midi_files': None,
-            'wav_files': None,
-            'temp_files': []
+            'midi_layout': None,
+            'loop_repeats': 1,
+            'preview_codec': None,
+            'overviews': None,
+            'playback_engine': None,
+            'master_audio': None
         })
 
+    audio_store = get_audio_store()
+    stem_store = get_stem_store()
+    release_inactive_sessions(audio_store, stem_store)
+    stages = get_stage_recorder()
+
     # Clear session
     if st.button("🧹 Clear Session"):
-        pygame.mixer.stop()
-        for file in st.session_state.temp_files:
-            try:
-                if os.path.exists(file):
-                    os.unlink(file)
-            except:
-                pass
+        stop_playback()
+        audio_store.release(current_session_id())
+        stem_store.release(current_session_id())
         st.session_state.update({
             'generated': False,
+            'note_table': None,
+            'output_folder': None,
             'midi_files': None,
-            'wav_files': None,
-            'temp_files': []
+            'midi_layout': None,
+            'loop_repeats': 1,
+            'overviews': None,
+            'master_audio': None
         })
         st.rerun()
 
     # Music generation
     prompt = st.text_area("Describe your music:", height=100)
+    force_fresh = st.checkbox("Force fresh generation (skip cache)")
     
     if st.button("🎶 Generate Music") and prompt:
         with st.spinner("Creating your music..."):
             try:
-                output_folder = create_timestamped_folder()
-                os.makedirs(output_folder, exist_ok=True)
+                with stages.span("generate.create_folder"):
+                    output_folder = create_timestamped_folder()
+                    os.makedirs(output_folder, exist_ok=True)
                 
-                # Generate MIDI files
-                midi_files = {
-                    'instrument': os.path.join(output_folder, 'instrument.mid'),
-                    'bass': os.path.join(output_folder, 'bass.mid'),
-                    'drums': os.path.join(output_folder, 'drums.mid')
-                }
-                
-                generator = MusicGenerator(api_key="your-api-key")
-                converter = MIDIConverter()
+                generator = get_generator(output_schema)
                 
-                gen_result = generator.generate_music_data(prompt)
+                with stages.span("generate.llm_request", force_fresh=force_fresh):
+                    gen_result = generator.generate_music_data(prompt, force_fresh=force_fresh)
                 if gen_result.get("status") != "success":
-                    st.error("Generation failed")
+                    st.error(f"Generation failed: {gen_result.get('message')}")
                     return
                 
-                midi_result = converter.convert_to_midi(
-                    gen_result["music_data"],
-                    instrument_file=midi_files["instrument"],
-                    bass_file=midi_files["bass"],
-                    drums_file=midi_files["drums"]
-                )
-                
-                if midi_result.get("status") != "success":
-                    st.error("MIDI conversion failed")
+                # Validate once into columnar form; every later stage reads
+                # the table instead of the raw JSON
+                try:
+                    with stages.span("generate.validate"):
+                        note_table = lazy_import("note_table").NoteTable.from_music_data(
+                            gen_result["music_data"]
+                        )
+                except (ValueError, AttributeError) as e:
+                    st.error(f"Invalid composition: {str(e)}")
                     return
                 
-                wav_files = {
-                    'instrument': generate_wav_preview(midi_files["instrument"]),
-                    'bass': generate_wav_preview(midi_files["bass"]),
-                    'drums': generate_wav_preview(midi_files["drums"], is_drum=True)
-                }
+                # Render previews from the in-memory note table; MIDI files
+                # are only written once the user asks for a download
+                with stages.span("generate.render_stems", notes=len(note_table)):
+                    stems = render_stems_parallel(note_table)
+                if loop_repeats > 1:
+                    # Only one pass is synthesized; the rest is tiled from it
+                    with stages.span("generate.tile_loop", repeats=loop_repeats):
+                        stems = tile_loop_stems(note_table, stems, loop_repeats, seamless_loop)
+                with stages.span("generate.encode_previews", codec=preview_codec):
+                    previews = {
+                        name: encode_stem_preview(audio, preview_codec)
+                        for name, audio in stems.items()
+                    }
                 
-                if not all(wav_files.values()):
+                if not all(previews.values()):
                     st.error("Failed to create audio previews")
                     return
+                with stages.span("generate.overviews"):
+                    overviews = build_overviews(stems)
+                if st.session_state.playback_engine is not None:
+                    # Still playing the previous generation's stems
+                    stop_playback()
+                audio_store.put(current_session_id(), previews)
+                # Playback and mixdown read the rendered samples, not the
+                # lossy, per-stem normalized previews
+                stem_store.put(current_session_id(), mix_stems(stems))
                 
                 # Update session state
                 st.session_state.update({
                     'generated': True,
-                    'midi_files': midi_files,
-                    'wav_files': wav_files,
-                    'temp_files': list(wav_files.values())
+                    'note_table': note_table,
+                    'output_folder': output_folder,
+                    'midi_files': None,
+                    'midi_layout': None,
+                    'loop_repeats': loop_repeats,
+                    'preview_codec': preview_codec,
+                    'overviews': overviews,
+                    'master_audio': None
                 })
-                st.success("Music generated!")
+                if gen_result.get("cached"):
+                    st.success("Music generated! (from cache)")
+                else:
+                    st.success("Music generated!")
                 
             except Exception as e:
                 st.error(f"Error: {str(e)}")
 
-    # Preview and downloads
-    if st.session_state.generated:
+    # Preview
+    previews = audio_store.get(current_session_id()) if st.session_state.generated else None
+    stems = stem_store.get(current_session_id()) if previews is not None else None
+    if st.session_state.generated and previews is None:
+        st.warning("Preview audio was released to free memory; generate again to listen.")
+    if previews is not None:
         # Playback controls
         st.subheader("Enhanced Preview")
         col1, col2 = st.columns(2)
         with col1:
-            if st.button("▶️ Play All Tracks"):
-                pygame.mixer.stop()
-                for i, (name, wav_path) in enumerate(st.session_state.wav_files.items()):
+            if st.button("▶️ Play All Tracks", disabled=stems is None):
+                with stages.span("playback.play_all", block_size=playback_block):
                     try:
-                        sound = pygame.mixer.Sound(wav_path)
-                        pygame.mixer.Channel(i).play(sound)
-                    except:
-                        pass
-                st.success("Playing enhanced mix!")
+                        start_playback(stems, playback_block)
+                        st.success("Playing enhanced mix!")
+                    except Exception as e:
+                        st.error(f"Playback error: {str(e)}")
         with col2:
             if st.button("⏹️ Stop All"):
-                pygame.mixer.stop()
+                stop_playback()
                 st.info("Playback stopped")
 
         # Individual track controls
         st.subheader("Track Controls")
         cols = st.columns(3)
-        for i, (name, wav_path) in enumerate(st.session_state.wav_files.items()):
+        for i, (name, data) in enumerate(previews.items()):
             with cols[i]:
                 st.write(f"**{name.capitalize()} Track**")
+                st.audio(data, format=f"audio/{st.session_state.preview_codec}")
                 if st.button(f"▶️ Play {name}", key=f"play_{name}"):
-                    sound = pygame.mixer.Sound(wav_path)
-                    pygame.mixer.Channel(i).play(sound)
+                    with stages.span("playback.play_stem", stem=name):
+                        mixer = get_mixer()
+                        sound = mixer.Sound(file=io.BytesIO(data))
+                        mixer.Channel(session_channel(i)).play(sound)
                 if st.button(f"⏹️ Stop {name}", key=f"stop_{name}"):
-                    pygame.mixer.Channel(i).stop()
+                    get_mixer().Channel(session_channel(i)).stop()
+                st.slider("Mix gain", 0.0, 2.0, 1.0, 0.1, key=f"gain_{name}")
+                mute_col, solo_col = st.columns(2)
+                mute_col.checkbox("Mute", key=f"mute_{name}")
+                solo_col.checkbox("Solo", key=f"solo_{name}")
 
-        # Downloads
-        st.subheader("Download")
-        zip_path = os.path.join(os.path.dirname(st.session_state.midi_files["instrument"]), "tracks.zip")
-        with zipfile.ZipFile(zip_path, 'w') as zipf:
-            for file in st.session_state.midi_files.values():
-                zipf.write(file, os.path.basename(file))
-        
-        with open(zip_path, "rb") as f:
+        engine = st.session_state.playback_engine
+        if engine is not None:
+            apply_playback_controls(engine)
+            latency = engine.latency()
+            if latency["total_ms"] is not None:
+                st.caption(
+                    f"Output latency {latency['total_ms']:.0f} ms "
+                    f"(queue {latency['queue_ms']:.0f} ms, max {latency['max_queue_ms']:.0f} ms; "
+                    f"device {latency['device_ms']:.0f} ms; "
+                    f"{latency['block_ms']:.0f} ms blocks, {engine.underruns} underruns)"
+                )
+
+        show_waveform_overviews(st.session_state.overviews)
+
+        # Mixdown of all stems into one master
+        if stems is None:
+            st.info("Mix audio was released to free memory; generate again to mix or play all tracks.")
+        if st.button("🎚️ Mix Down", disabled=stems is None):
+            with stages.span("playback.mix_down", codec=download_codec):
+                mixdown_api = lazy_import("mixdown_api")
+                master = io.BytesIO()
+                mix_result = mixdown_api.mixdown(
+                    stems,
+                    master,
+                    gains={
+                        name: st.session_state[f"gain_{name}"]
+                        for name in previews
+                    },
+                    codec=download_codec
+                )
+            if mix_result.get("status") == "success":
+                st.session_state.master_audio = (download_codec, master.getvalue())
+            else:
+                st.error(f"Mixdown failed: {mix_result.get('message')}")
+
+        if st.session_state.master_audio:
+            codec, data = st.session_state.master_audio
+            st.audio(data, format=f"audio/{codec}")
             st.download_button(
-                "Download All (ZIP)",
-                f,
-                file_name="music_tracks.zip"
+                f"⬇️ Master Mix ({codec.upper()})",
+                data,
+                file_name=f"master.{codec}"
             )
 
-        cols = st.columns(3)
-        for i, (name, path) in enumerate(st.session_state.midi_files.items()):
-            with cols[i]:
-                with open(path, "rb") as f:
-                    st.download_button(
-                        f"⬇️ {name.capitalize()} Track",
-                        f,
-                        file_name=f"{name}.mid"
+    # Downloads only need the note table, so they outlive evicted previews
+    if st.session_state.generated:
+        st.subheader("Download")
+        if st.session_state.midi_layout != midi_layout:
+            # Layout changed since the files were written
+            st.session_state.midi_files = None
+        if st.session_state.midi_files is None:
+            if st.button("📦 Prepare MIDI Download"):
+                with stages.span("download.write_midi", layout=midi_layout):
+                    note_table = st.session_state.note_table
+                    if st.session_state.loop_repeats > 1:
+                        note_table = note_table.repeated(st.session_state.loop_repeats)
+                    midi_files = write_midi_files(
+                        note_table,
+                        st.session_state.output_folder,
+                        midi_layout
                     )
+                if midi_files is None:
+                    st.error("MIDI conversion failed")
+                else:
+                    st.session_state.midi_files = midi_files
+                    st.session_state.midi_layout = midi_layout
+                    st.rerun()
+            return
+
+        zip_bytes, track_bytes = build_download_payloads(
+            st.session_state.output_folder,
+            st.session_state.midi_layout,
+            st.session_state.midi_files
+        )
+        st.download_button(
+            "Download All (ZIP)",
+            zip_bytes,
+            file_name="music_tracks.zip"
+        )
+
+        cols = st.columns(len(track_bytes))
+        for i, (name, data) in enumerate(track_bytes.items()):
+            label = "Multitrack MIDI" if name == 'multitrack' else f"{name.capitalize()} Track"
+            with cols[i]:
+                st.download_button(
+                    f"⬇️ {label}",
+                    data,
+                    file_name=os.path.basename(st.session_state.midi_files[name])
+                )
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    try:
+        main()
+    finally:
+        # Drawn last so it includes spans from this run, even after an
+        # early return
+        show_stage_timings()
\ No newline at end of file
@@ -0,0 +1,62 @@
+import io
+import time
+import numpy as np
+from midiutil import MIDIFile
+from note_table import NOTE_DTYPE
+from smf_writer import encode_midi_file
+
+NOTE_COUNTS = (1_000, 10_000, 100_000, 1_000_000)
+TEMPO = 120
+
+def random_notes(count, seed=0):
+    """Non-overlapping notes: each pitch is struck at most once per beat"""
+    rng = np.random.default_rng(seed)
+    notes = np.zeros(count, dtype=NOTE_DTYPE)
+    # Spread pitches over 0-127 so every (beat, pitch) slot is unique
+    slots = rng.choice(count * 4, count, replace=False)
+    notes['time'] = slots // 128 + rng.choice([0, 0.25, 0.5], count)
+    notes['pitch'] = slots % 128
+    notes['duration'] = rng.choice([0.25, 0.5], count)
+    notes['velocity'] = rng.integers(1, 128, count)
+    return notes
+
+def midiutil_bytes(notes, channel=0, program=0):
+    """What MIDIConverter wrote before smf_writer: one addNote per row"""
+    midi = MIDIFile(1)
+    midi.addTempo(track=0, time=0, tempo=TEMPO)
+    midi.addProgramChange(tracknum=0, channel=channel, time=0, program=program)
+    for start, duration, pitch, velocity in notes.tolist():
+        midi.addNote(track=0, channel=channel, pitch=pitch, time=start,
+                     duration=duration, volume=velocity)
+    output = io.BytesIO()
+    midi.writeFile(output)
+    return output.getvalue()
+
+def smf_bytes(notes, channel=0, program=0):
+    return encode_midi_file(TEMPO, [(notes, channel, program, None)])
+
+def time_call(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def run_benchmark(note_counts=NOTE_COUNTS):
+    rows = []
+    for count in note_counts:
+        notes = random_notes(count)
+        legacy, legacy_time = time_call(midiutil_bytes, notes)
+        vectorized, vectorized_time = time_call(smf_bytes, notes)
+        rows.append({
+            "notes": count,
+            "midiutil_s": legacy_time,
+            "smf_writer_s": vectorized_time,
+            "speedup": legacy_time / vectorized_time,
+            "identical": legacy == vectorized
+        })
+    return rows
+
+if __name__ == "__main__":
+    print(f"{'notes':>10} {'MIDIUtil (s)':>13} {'smf_writer (s)':>15} {'speedup':>9} {'identical':>10}")
+    for row in run_benchmark():
+        print(f"{row['notes']:>10} {row['midiutil_s']:>13.4f} {row['smf_writer_s']:>15.4f} "
+              f"{row['speedup']:>8.1f}x {str(row['identical']):>10}")
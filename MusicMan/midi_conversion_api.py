@@ -1,85 +1,56 @@
-from midiutil import MIDIFile
 import json
+from note_table import as_note_table
+from smf_writer import write_midi_file
 
 class MIDIConverter:
+    # Drums sit on the GM percussion channel and carry no program change
+    TRACK_CHANNELS = {"instrument": 0, "bass": 1, "drums": 9}
+    
+    def _track(self, table, name, named=False):
+        """smf_writer track tuple for one NoteTable track"""
+        return (table.tracks[name], self.TRACK_CHANNELS[name],
+                table.programs.get(name), name if named else None)
+    
     def convert_to_midi(self, music_data, instrument_file="instrument.mid", 
                        bass_file="bass.mid", drums_file="drums.mid"):
-        """Convert music data dictionary to MIDI files"""
+        """Convert music data dictionary (or NoteTable) to MIDI files"""
         try:
-            tempo = music_data.get("tempo", 120)
-            
-            # Instrument track
-            midi_instrument = MIDIFile(1)
-            midi_instrument.addTempo(track=0, time=0, tempo=tempo)
-            midi_instrument.addProgramChange(
-                tracknum=0, channel=0, time=0, 
-                program=int(music_data["instrument"].get("program", 0))
-            )
-            
-            for note in music_data["instrument"]["notes"]:
-                if "pitch" in note:
-                    midi_instrument.addNote(
-                        track=0, channel=0,
-                        pitch=note["pitch"],
-                        time=note["time"],
-                        duration=note["duration"],
-                        volume=note.get("velocity", 100)
-                    )
-                elif "pitches" in note:
-                    for pitch in note["pitches"]:
-                        midi_instrument.addNote(
-                            track=0, channel=0,
-                            pitch=pitch,
-                            time=note["time"],
-                            duration=note["duration"],
-                            volume=note.get("velocity", 100)
-                        )
-            
-            # Bass track
-            midi_bass = MIDIFile(1)
-            midi_bass.addTempo(track=0, time=0, tempo=tempo)
-            midi_bass.addProgramChange(
-                tracknum=0, channel=1, time=0, 
-                program=int(music_data["bass"].get("program", 32))
-            )
-            
-            for note in music_data["bass"]["notes"]:
-                midi_bass.addNote(
-                    track=0, channel=1,
-                    pitch=note["pitch"],
-                    time=note["time"],
-                    duration=note["duration"],
-                    volume=note.get("velocity", 100)
-                )
+            table = as_note_table(music_data)
+            output_files = {
+                "instrument": instrument_file,
+                "bass": bass_file,
+                "drums": drums_file
+            }
             
-            # Drums track
-            midi_drums = MIDIFile(1)
-            midi_drums.addTempo(track=0, time=0, tempo=tempo)
+            for name, path in output_files.items():
+                write_midi_file(path, table.tempo, [self._track(table, name)])
+                
+            return {
+                "status": "success",
+                "output_files": output_files
+            }
             
-            for note in music_data["drums"]["notes"]:
-                midi_drums.addNote(
-                    track=0, channel=9,
-                    pitch=note["pitch"],
-                    time=note["time"],
-                    duration=note["duration"],
-                    volume=note.get("velocity", 100)
-                )
+        except Exception as e:
+            return {
+                "status": "error",
+                "message": str(e)
+            }
+
+    def convert_to_multitrack_midi(self, music_data, output_file="music.mid"):
+        """Write all three tracks into one type-1 MIDI file.
+
+        Each track keeps its own channel and program and is named after its
+        stem, so readers can split the file back into stems.
+        """
+        try:
+            table = as_note_table(music_data)
+            tracks = [self._track(table, name, named=True)
+                      for name in self.TRACK_CHANNELS]
+            write_midi_file(output_file, table.tempo, tracks)
             
-            # Write files
-            with open(instrument_file, "wb") as f:
-                midi_instrument.writeFile(f)
-            with open(bass_file, "wb") as f:
-                midi_bass.writeFile(f)
-            with open(drums_file, "wb") as f:
-                midi_drums.writeFile(f)
-                
             return {
                 "status": "success",
-                "output_files": {
-                    "instrument": instrument_file,
-                    "bass": bass_file,
-                    "drums": drums_file
-                }
+                "output_files": {"multitrack": output_file}
             }
             
         except Exception as e:
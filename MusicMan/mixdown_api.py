@@ -0,0 +1,121 @@
+import io
+import os
+import numpy as np
+import soundfile as sf
+import time
+from audio_synthesis_api import SAMPLE_RATE, PREVIEW_PEAK, STEM_LEVELS, LoopedStem
+from audio_buffers import ENCODE_CHUNK_SIZE, open_encoder, record_encode
+
+# Samples per block; bounds memory to a few blocks regardless of length
+MIX_BLOCK_SIZE = ENCODE_CHUNK_SIZE
+
+class _StemReader:
+    """Block access to a stem held as an array, a LoopedStem, encoded audio
+    bytes or an audio file.
+
+    Encoded bytes are already in memory, so they are decoded once up front
+    rather than once per pass. Files are read in order and only seeked
+    when a pass starts over.
+    """
+
+    def __init__(self, source):
+        if isinstance(source, (bytes, bytearray)):
+            audio, _ = sf.read(io.BytesIO(source), dtype='float32', always_2d=True)
+            source = audio.mean(axis=1)
+        if isinstance(source, (str, io.IOBase)):
+            self._file = sf.SoundFile(source)
+            self._array = None
+            self.length = self._file.frames
+        else:
+            self._file = None
+            self._array = source if isinstance(source, LoopedStem) else np.asarray(source)
+            self.length = len(self._array)
+        self._position = 0
+
+    def read(self, start, stop):
+        """Mono float64 samples [start, stop), zero-padded past the end"""
+        stop_in = min(stop, self.length)
+        if start >= stop_in:
+            return np.zeros(stop - start)
+        if self._file is not None:
+            if start != self._position:
+                self._file.seek(start)
+            block = self._file.read(stop_in - start, dtype='float64', always_2d=True)
+            block = block.mean(axis=1)
+            self._position = stop_in
+        else:
+            block = self._array[start:stop_in].astype(np.float64)
+        if stop_in < stop:
+            block = np.concatenate([block, np.zeros(stop - stop_in)])
+        return block
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+def _mixed_blocks(readers, scales, length, block_size):
+    for start in range(0, length, block_size):
+        stop = min(start + block_size, length)
+        block = np.zeros(stop - start)
+        for reader, scale in zip(readers, scales):
+            if scale:
+                block += scale * reader.read(start, stop)
+        yield block
+
+def mixdown(stems, output_file, gains=None, peak=PREVIEW_PEAK, codec='wav',
+            block_size=MIX_BLOCK_SIZE, sample_rate=SAMPLE_RATE, levels=STEM_LEVELS):
+    """Sum stems into one master file with a single shared normalization.
+
+    `stems` maps names to arrays, LoopedStems, encoded audio bytes or
+    audio file paths, and `gains` maps names to linear gains (default 1.0). Each stem
+    is scaled by its entry in `levels` (default 1.0), which puts raw
+    render_stem output on one level; pass `levels={}` for stems that are
+    already balanced. Stems are summed at that level times their gain and
+    only the mix is normalized, once, to `peak`. Everything runs block by block, so only a
+    few blocks are in memory at any time. `output_file` may be a path or a
+    writable file-like object; `codec` is a key of audio_buffers.CODECS.
+    """
+    gains = gains or {}
+    readers = {}
+    try:
+        for name, source in stems.items():
+            readers[name] = _StemReader(source)
+        length = max((reader.length for reader in readers.values()), default=0)
+        if length == 0:
+            return {"status": "error", "message": "No audio to mix"}
+
+        scales = [gains.get(name, 1.0) * levels.get(name, 1.0) for name in readers]
+
+        # Pass 1: peak of the summed mix
+        mix_peak = 0.0
+        for block in _mixed_blocks(readers.values(), scales, length, block_size):
+            mix_peak = max(mix_peak, float(np.max(np.abs(block))))
+        master_gain = peak / mix_peak if mix_peak > 0 else 0.0
+
+        # Pass 2: normalize and encode
+        start = time.perf_counter()
+        with open_encoder(output_file, codec, sample_rate) as out:
+            for block in _mixed_blocks(readers.values(), scales, length, block_size):
+                out.write(block * master_gain)
+        if hasattr(output_file, "seek"):
+            # The encoder may have seeked back to patch headers
+            n_bytes = output_file.seek(0, io.SEEK_END)
+        else:
+            n_bytes = os.path.getsize(output_file)
+        record_encode(codec, n_bytes, length / sample_rate,
+                      time.perf_counter() - start)
+
+        return {
+            "status": "success",
+            "output_file": output_file,
+            "duration": length / sample_rate,
+            "master_gain": master_gain
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+    finally:
+        for reader in readers.values():
+            reader.close()
@@ -1,16 +1,68 @@
+import asyncio
 import openai
 import json
+import random
+import threading
+import time
+from streaming_json_parser import NoteStreamParser, TRACK_NAMES
+from compact_schema import DEFAULT_VELOCITY, decode_compact, decode_note
+from note_table import NoteTable
 
-class MusicGenerator:
-    def __init__(self, api_key):
-        self.client = openai.OpenAI(api_key="xxxxx")
-    
-    def generate_music_data(self, prompt):
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": """You are a music composition assistant. Generate musical note data in JSON format for three separate tracks: instrument, bass, and drums. This should be tracks that can be looped to make one overarching beat, bassically a sample.
+# Network defaults. Seconds to open a connection and to wait between reads
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 60.0
+# Retries after the first attempt, with full-jitter exponential backoff
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+# Wall-clock budget for one generation, retries and backoff included
+GENERATION_DEADLINE = 180.0
+# Statuses worth another attempt; anything else is the request's own fault
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def shared_client(base_url=None, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT):
+    """One OpenAI client per process and configuration.
+
+    Its HTTP connection pool keeps connections alive between requests, so
+    generations after the first skip connection setup. Retries are left to
+    MusicGenerator, which knows the generation deadline.
+    """
+    key = (base_url, connect_timeout, read_timeout)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = openai.OpenAI(
+                api_key="xxxxx",
+                base_url=base_url,
+                timeout=openai.Timeout(read_timeout, connect=connect_timeout),
+                max_retries=0
+            )
+    return client
+
+def is_retryable(error):
+    """Connection failures, timeouts, rate limits and server errors"""
+    if isinstance(error, openai.APIConnectionError):
+        # Includes APITimeoutError
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in RETRYABLE_STATUS
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    """Seconds to wait before retry number `attempt` (from 0), drawn
+    uniformly up to the exponential step so clients don't retry in step"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def retry_after(error):
+    """Server-requested wait in seconds from a Retry-After header, or 0"""
+    response = getattr(error, "response", None)
+    try:
+        return max(0.0, float(response.headers.get("retry-after", 0)))
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
+
+SYSTEM_PROMPT = """You are a music composition assistant. Generate musical note data in JSON format for three separate tracks: instrument, bass, and drums. This should be tracks that can be looped to make one overarching beat, bassically a sample.
                 The output should be a JSON object with:
                 - "instrument": {
                     "notes": an array of objects, each containing:
@@ -71,37 +123,359 @@ class MusicGenerator:
                 7. Use music theory for harmonic relationships between tracks
                 8. No direct repetition - create evolving musical ideas
                 9. The drums should be very complex
-                10. The Track itself should be original, no basic patterns, have lots of complexeity and almsot shifting music"""},
-                    {"role": "user", "content": f"Create a three-part musical piece based on: {prompt}. Use tempo between 60-180 BPM and set total_beats to at least (tempo / 3) to ensure minimum 20 seconds duration."}
-                ],
-                response_format={"type": "json_object"}
-            )
+                10. The Track itself should be original, no basic patterns, have lots of complexeity and almsot shifting music"""
+
+# Same brief with notes as arrays instead of objects, which roughly halves
+# the output tokens; decoded by compact_schema.decode_compact. The
+# timing rules and guidelines are shared with SYSTEM_PROMPT.
+COMPACT_SYSTEM_PROMPT = f"""You are a music composition assistant. Generate musical note data in compact JSON format for three separate tracks: instrument, bass, and drums. This should be tracks that can be looped to make one overarching beat, bassically a sample.
+                The output should be a JSON object with:
+                - "instrument": {{"program": MIDI instrument number (0-127), "notes": array of notes}}
+                - "bass": {{"program": MIDI bass instrument number (32-39 recommended), "notes": array of notes with single pitches only}}
+                - "drums": {{"notes": array of notes using General MIDI drum note numbers}}
+                - "tempo": in BPM (must be between 60-180)
+                - "time_signature": "4/4" or similar
+                - "total_beats": total length of composition in beats (must be at least 20 beats)
+                
+                Every note is an array [time, duration, pitch, velocity]: start time in beats, duration in beats, MIDI note number (60 = middle C) or an array of MIDI numbers for a chord, and volume (0-127). Leave velocity out when it is {DEFAULT_VELOCITY}.
+                Example notes: [0, 1, 60], [1, 2, [60, 64, 67], 80]
+                
+                {SYSTEM_PROMPT[SYSTEM_PROMPT.index("Calculations for time:"):]}"""
+
+SCHEMAS = {"verbose": SYSTEM_PROMPT, "compact": COMPACT_SYSTEM_PROMPT}
+
+class MusicGenerator:
+    def __init__(self, api_key, model="gpt-3.5-turbo", base_url=None, cache=None,
+                 connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 max_retries=MAX_RETRIES, deadline=GENERATION_DEADLINE, schema="verbose"):
+        if schema not in SCHEMAS:
+            raise ValueError(f"Unknown schema {schema!r}, expected one of {sorted(SCHEMAS)}")
+        self.client = shared_client(base_url, connect_timeout, read_timeout)
+        # Output format asked of the model; results are music_data either way
+        self.schema = schema
+        self.system_prompt = SCHEMAS[schema]
+        self.model = model
+        self.cache = cache
+        self.base_url = base_url
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.deadline = deadline
+        # Request counters for this generator, see stats()
+        self._stats = {"requests": 0, "attempts": 0, "retries": 0, "deadline_exceeded": 0}
+        self._stats_lock = threading.Lock()
+    
+    def new_async_client(self):
+        """AsyncOpenAI client for one batch; the caller closes it.
+
+        Not shared like `client`: an async connection pool belongs to the
+        event loop it is used on, and every asyncio.run() starts a new one.
+        """
+        return openai.AsyncOpenAI(
+            api_key="xxxxx",
+            base_url=self.base_url,
+            timeout=openai.Timeout(self.read_timeout, connect=self.connect_timeout),
+            max_retries=0
+        )
+    
+    def stats(self):
+        """Requests made, attempts including retries, and deadline misses"""
+        with self._stats_lock:
+            return dict(self._stats)
+    
+    def _count(self, field):
+        with self._stats_lock:
+            self._stats[field] += 1
+    
+    def _deadline_error(self, what="No response"):
+        self._count("deadline_exceeded")
+        return TimeoutError(f"{what} within the {self.deadline:g}s generation deadline")
+    
+    def _attempt_timeout(self, deadline_at):
+        """Timeouts for the next attempt, capped by what is left of the
+        deadline; raises TimeoutError once it has passed"""
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            raise self._deadline_error()
+        return openai.Timeout(min(self.read_timeout, remaining),
+                              connect=min(self.connect_timeout, remaining))
+    
+    def _retry_delay(self, error, attempt, deadline_at):
+        """Backoff before the next attempt, or None to give up on `error`.
+        Raises TimeoutError when the deadline leaves no room for a retry."""
+        if not is_retryable(error) or attempt >= self.max_retries:
+            return None
+        delay = max(backoff_delay(attempt), retry_after(error))
+        if time.monotonic() + delay >= deadline_at:
+            raise self._deadline_error(f"No response ({error})") from error
+        self._count("retries")
+        return delay
+    
+    def _with_retries(self, request, deadline_at):
+        """Call `request(timeout)` until it succeeds, fails for good, or the
+        deadline passes"""
+        self._count("requests")
+        attempt = 0
+        while True:
+            timeout = self._attempt_timeout(deadline_at)
+            self._count("attempts")
+            try:
+                return request(timeout)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline_at)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+            attempt += 1
+    
+    async def _awith_retries(self, request, deadline_at):
+        """Async version of _with_retries"""
+        self._count("requests")
+        attempt = 0
+        while True:
+            timeout = self._attempt_timeout(deadline_at)
+            self._count("attempts")
+            try:
+                return await request(timeout)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, deadline_at)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
+    
+    def _messages(self, prompt, streaming=False):
+        user_content = f"Create a three-part musical piece based on: {prompt}. Use tempo between 60-180 BPM and set total_beats to at least (tempo / 3) to ensure minimum 20 seconds duration."
+        if streaming:
+            # Tempo up front lets listeners convert beats to seconds early
+            user_content += ' Write the "tempo" field before the tracks.'
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": user_content}
+        ]
+    
+    def _decode(self, data):
+        """music_data from the parsed response document"""
+        return decode_compact(data) if self.schema == "compact" else data
+    
+    def _request_music_data(self, prompt):
+        """One chat completion, retried within the deadline, parsed into
+        music_data"""
+        response = self._with_retries(
+            lambda timeout: self.client.chat.completions.create(
+                model=self.model,
+                messages=self._messages(prompt),
+                response_format={"type": "json_object"},
+                timeout=timeout
+            ),
+            time.monotonic() + self.deadline
+        )
+        return self._decode(json.loads(response.choices[0].message.content))
+    
+    async def _arequest_music_data(self, prompt, client=None):
+        """Async version of _request_music_data. Without `client`, opens
+        and closes one just for this request."""
+        if client is None:
+            async with self.new_async_client() as client:
+                return await self._arequest_music_data(prompt, client)
+
+        response = await self._awith_retries(
+            lambda timeout: client.chat.completions.create(
+                model=self.model,
+                messages=self._messages(prompt),
+                response_format={"type": "json_object"},
+                timeout=timeout
+            ),
+            time.monotonic() + self.deadline
+        )
+        return self._decode(json.loads(response.choices[0].message.content))
+    
+    def _stream_music_data(self, prompt, parser):
+        """Feed a streamed completion into `parser` as it arrives.
+
+        Only opening the stream is retried: once notes have reached the
+        parser's callbacks they cannot be taken back.
+        """
+        deadline_at = time.monotonic() + self.deadline
+        stream = self._with_retries(
+            lambda timeout: self.client.chat.completions.create(
+                model=self.model,
+                messages=self._messages(prompt, streaming=True),
+                response_format={"type": "json_object"},
+                stream=True,
+                timeout=timeout
+            ),
+            deadline_at
+        )
+        with stream:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parser.feed(chunk.choices[0].delta.content)
+                if time.monotonic() > deadline_at:
+                    raise self._deadline_error("Stream not finished")
+        return self._decode(parser.finish())
+    
+    def _build_result(self, music_data, cached):
+        """Validate music_data, fix up the duration and wrap it in the
+        result dict; raises ValueError if the notes are malformed"""
+        NoteTable.from_music_data(music_data)
+
+        # Calculate and verify duration
+        tempo = music_data.get("tempo", 120)
+        total_beats = music_data.get("total_beats", max(40, int(tempo / 3 * 2)))
+        calculated_duration = (total_beats * 60) / tempo
+        
+        # Force minimum duration of 20 seconds
+        if calculated_duration < 20:
+            total_beats = int((20 * tempo) / 60)
+            music_data["total_beats"] = total_beats
+            calculated_duration = 20
+        
+        return {
+            "status": "success",
+            "cached": cached,
+            "music_data": music_data,
+            "metadata": {
+                "tempo": tempo,
+                "time_signature": music_data.get("time_signature"),
+                "duration": calculated_duration,
+                "total_beats": total_beats,
+                "instrument_program": music_data["instrument"].get("program"),
+                "bass_program": music_data["bass"].get("program")
+            }
+        }
+    
+    def generate_music_data(self, prompt, force_fresh=False):
+        try:
+            cached = False
+            if self.cache is None:
+                music_data = self._request_music_data(prompt)
+            else:
+                key = self.cache.make_key(prompt, self.model, self.system_prompt)
+                music_data = None if force_fresh else self.cache.get(key)
+                cached = music_data is not None
+                if not cached:
+                    music_data = self._request_music_data(prompt)
             
-            music_data = json.loads(response.choices[0].message.content)
+            result = self._build_result(music_data, cached)
+            # Only documents that validate are worth replaying
+            if self.cache is not None and not cached:
+                self.cache.put(key, music_data)
+            return result
             
-            # Calculate and verify duration
-            tempo = music_data.get("tempo", 120)
-            total_beats = music_data.get("total_beats", max(40, int(tempo / 3 * 2)))
-            calculated_duration = (total_beats * 60) / tempo
+        except Exception as e:
+            return {
+                "status": "error",
+                "message": str(e)
+            }
+    
+    async def agenerate_music_data(self, prompt, force_fresh=False, client=None):
+        """Async version of generate_music_data; same result shape.
+
+        `client` is an AsyncOpenAI client from new_async_client, reused
+        across calls on one event loop; without it each call opens its own.
+        """
+        try:
+            cached = False
+            if self.cache is None:
+                music_data = await self._arequest_music_data(prompt, client)
+            else:
+                key = self.cache.make_key(prompt, self.model, self.system_prompt)
+                music_data = None if force_fresh else self.cache.get(key)
+                cached = music_data is not None
+                if not cached:
+                    music_data = await self._arequest_music_data(prompt, client)
             
-            # Force minimum duration of 20 seconds
-            if calculated_duration < 20:
-                total_beats = int((20 * tempo) / 60)
-                music_data["total_beats"] = total_beats
-                calculated_duration = 20
+            result = self._build_result(music_data, cached)
+            # Only documents that validate are worth replaying
+            if self.cache is not None and not cached:
+                self.cache.put(key, music_data)
+            return result
             
+        except Exception as e:
             return {
-                "status": "success",
-                "music_data": music_data,
-                "metadata": {
-                    "tempo": tempo,
-                    "time_signature": music_data.get("time_signature"),
-                    "duration": calculated_duration,
-                    "total_beats": total_beats,
-                    "instrument_program": music_data["instrument"].get("program"),
-                    "bass_program": music_data["bass"].get("program")
-                }
+                "status": "error",
+                "message": str(e)
             }
+    
+    async def generate_batch(self, prompts, concurrency=4, timeout=120, force_fresh=False):
+        """Generate many prompts at once, at most `concurrency` in flight.
+
+        Async generator yielding (index, prompt, result) tuples in
+        completion order, where `result` is what generate_music_data would
+        return. A prompt that takes longer than `timeout` seconds yields an
+        error result instead of holding up the batch. Requests share one
+        client, closed when the batch ends.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        client = self.new_async_client()
+        
+        async def run(index, prompt):
+            async with semaphore:
+                try:
+                    result = await asyncio.wait_for(
+                        self.agenerate_music_data(prompt, force_fresh=force_fresh, client=client),
+                        timeout
+                    )
+                except asyncio.TimeoutError:
+                    result = {
+                        "status": "error",
+                        "message": f"Timed out after {timeout}s"
+                    }
+            return index, prompt, result
+        
+        tasks = [asyncio.ensure_future(run(index, prompt))
+                 for index, prompt in enumerate(prompts)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Consumer stopped early; don't leave requests running
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await client.close()
+    
+    def stream_music_data(self, prompt, on_note=None, on_field=None, force_fresh=False):
+        """Like generate_music_data, but consumes the completion as a stream.
+
+        `on_note(track, note)` fires for each note as soon as it has been
+        received, and `on_field(key, value)` for top-level values such as
+        tempo (see NoteStreamParser). A cache hit replays the cached notes
+        through the same callbacks before returning.
+        """
+        try:
+            key = None
+            music_data = None
+            if self.cache is not None:
+                key = self.cache.make_key(prompt, self.model, self.system_prompt)
+                if not force_fresh:
+                    music_data = self.cache.get(key)
+            
+            cached = music_data is not None
+            if cached:
+                if on_field is not None:
+                    for field, value in music_data.items():
+                        if field not in TRACK_NAMES:
+                            on_field(field, value)
+                for track in TRACK_NAMES:
+                    if on_field is not None and "program" in music_data[track]:
+                        on_field(f"{track}.program", music_data[track]["program"])
+                    if on_note is not None:
+                        for note in music_data[track]["notes"]:
+                            on_note(track, note)
+            else:
+                parser = NoteStreamParser(
+                    on_note=on_note, on_field=on_field,
+                    note_decoder=decode_note if self.schema == "compact" else None
+                )
+                music_data = self._stream_music_data(prompt, parser)
+            
+            result = self._build_result(music_data, cached)
+            # Only documents that validate are worth replaying
+            if key is not None and not cached:
+                self.cache.put(key, music_data)
+            return result
             
         except Exception as e:
             return {
@@ -0,0 +1,184 @@
+import numpy as np
+
+TRACK_NAMES = ('instrument', 'bass', 'drums')
+DEFAULT_PROGRAMS = {'instrument': 0, 'bass': 32}
+DEFAULT_VELOCITY = 100
+
+# One row per sounding pitch; chords are flattened into consecutive rows.
+# Times stay float64 beats so conversions match the dict path exactly.
+NOTE_DTYPE = np.dtype([
+    ('time', np.float64),
+    ('duration', np.float64),
+    ('pitch', np.uint8),
+    ('velocity', np.uint8),
+])
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _number_column(name, field, values):
+    """float64 column of JSON numbers; strings, nulls, booleans and arrays
+    are rejected rather than parsed or coerced by NumPy"""
+    if not set(map(type, values)) <= {int, float}:
+        raise ValueError(f"{name} note {field} values must be numbers")
+    return np.asarray(values, dtype=np.float64)
+
+class NoteTable:
+    """Validated, columnar form of music_data.
+
+    Each track is a NumPy structured array of NOTE_DTYPE in the order the
+    notes appeared, so every later stage can work on whole columns instead
+    of walking per-note dicts.
+    """
+
+    def __init__(self, tracks, programs=None, tempo=120, time_signature=None,
+                 total_beats=None):
+        self.tracks = tracks
+        self.programs = dict(DEFAULT_PROGRAMS, **(programs or {}))
+        self.tempo = tempo
+        self.time_signature = time_signature
+        self.total_beats = total_beats
+
+    @classmethod
+    def from_music_data(cls, music_data):
+        """Build and validate a table; raises ValueError on bad input"""
+        if not isinstance(music_data, dict):
+            raise ValueError("composition must be a JSON object")
+        tempo = music_data.get("tempo", 120)
+        if not _is_number(tempo) or tempo <= 0:
+            raise ValueError(f"tempo must be a positive number, got {tempo!r}")
+
+        tracks = {}
+        programs = {}
+        for name in TRACK_NAMES:
+            track = music_data.get(name)
+            if not isinstance(track, dict) or not isinstance(track.get("notes"), list):
+                raise ValueError(f"{name} must be an object with a notes array")
+            tracks[name] = cls._track_array(name, track["notes"])
+            if name in DEFAULT_PROGRAMS:
+                program = track.get("program", DEFAULT_PROGRAMS[name])
+                if not _is_number(program) or not 0 <= program <= 127 or program != int(program):
+                    raise ValueError(f"{name} program must be an integer in 0-127, got {program!r}")
+                programs[name] = int(program)
+
+        return cls(tracks, programs, tempo, music_data.get("time_signature"),
+                   music_data.get("total_beats"))
+
+    @staticmethod
+    def _track_array(name, notes):
+        times, durations, pitches, velocities = [], [], [], []
+        try:
+            for note in notes:
+                if not isinstance(note, dict):
+                    raise ValueError(f"{name} notes must be objects, got {note!r}")
+                if "pitch" in note:
+                    chord = [note["pitch"]]
+                elif isinstance(note.get("pitches"), list) and note["pitches"]:
+                    chord = note["pitches"]
+                else:
+                    raise ValueError(f"{name} note needs a pitch or a non-empty pitches array: {note!r}")
+                velocity = note.get("velocity", DEFAULT_VELOCITY)
+                for pitch in chord:
+                    times.append(note["time"])
+                    durations.append(note["duration"])
+                    pitches.append(pitch)
+                    velocities.append(velocity)
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"{name} has a malformed note: missing or bad {e}")
+
+        table = np.zeros(len(times), dtype=NOTE_DTYPE)
+        if not len(table):
+            return table
+
+        columns = {
+            'time': _number_column(name, 'time', times),
+            'duration': _number_column(name, 'duration', durations),
+            'pitch': _number_column(name, 'pitch', pitches),
+            'velocity': _number_column(name, 'velocity', velocities),
+        }
+        # Checked column-wise rather than note by note
+        if not np.all(np.isfinite(columns['time'])) or np.any(columns['time'] < 0):
+            raise ValueError(f"{name} note times must be finite and non-negative")
+        if not np.all(np.isfinite(columns['duration'])) or np.any(columns['duration'] < 0):
+            raise ValueError(f"{name} note durations must be finite and non-negative")
+        for field in ('pitch', 'velocity'):
+            values = columns[field]
+            if np.any((values < 0) | (values > 127)) or np.any(values != np.floor(values)):
+                raise ValueError(f"{name} {field} values must be integers in 0-127")
+
+        for field, values in columns.items():
+            table[field] = values
+        return table
+
+    @property
+    def seconds_per_beat(self):
+        return 60.0 / self.tempo
+
+    def onsets(self, name):
+        """Note start times of a track in seconds"""
+        return self.tracks[name]['time'] * self.seconds_per_beat
+
+    def offsets(self, name):
+        """Note end times of a track in seconds"""
+        track = self.tracks[name]
+        return (track['time'] + track['duration']) * self.seconds_per_beat
+
+    def spans(self, name):
+        """(start, end, pitch, velocity) tuples in seconds for one track"""
+        track = self.tracks[name]
+        return list(zip(self.onsets(name).tolist(), self.offsets(name).tolist(),
+                        track['pitch'].tolist(), track['velocity'].tolist()))
+
+    @property
+    def loop_beats(self):
+        """Length of one pass in beats: total_beats, or the last note end
+        rounded up to a whole beat when total_beats is missing"""
+        if isinstance(self.total_beats, (int, float)) and self.total_beats > 0:
+            return self.total_beats
+        ends = [track['time'] + track['duration'] for track in self.tracks.values()]
+        return float(np.ceil(max((end.max(initial=0) for end in ends), default=0))) or 1.0
+
+    def repeated(self, times, loop_beats=None):
+        """A table playing this one `times` times back to back.
+
+        Rows are tiled and shifted column-wise, without going back through
+        music_data.
+        """
+        loop_beats = self.loop_beats if loop_beats is None else loop_beats
+        tracks = {}
+        for name, track in self.tracks.items():
+            tiled = np.tile(track, times)
+            tiled['time'] += np.repeat(np.arange(times) * loop_beats, len(track))
+            tracks[name] = tiled
+        return NoteTable(tracks, self.programs, self.tempo, self.time_signature,
+                         loop_beats * times)
+
+    @property
+    def nbytes(self):
+        return sum(track.nbytes for track in self.tracks.values())
+
+    def __len__(self):
+        return sum(len(track) for track in self.tracks.values())
+
+    def to_music_data(self):
+        """Back to the dict layout, one note per row (chords come back split)"""
+        music_data = {
+            "tempo": self.tempo,
+            "time_signature": self.time_signature,
+            "total_beats": self.total_beats,
+        }
+        for name, track in self.tracks.items():
+            notes = [
+                {"pitch": pitch, "time": time, "duration": duration, "velocity": velocity}
+                for time, duration, pitch, velocity in track.tolist()
+            ]
+            music_data[name] = {"notes": notes}
+            if name in self.programs:
+                music_data[name]["program"] = self.programs[name]
+        return music_data
+
+def as_note_table(data):
+    """Accept a NoteTable or a music_data dict; always return a NoteTable"""
+    if isinstance(data, NoteTable):
+        return data
+    return NoteTable.from_music_data(data)
@@ -0,0 +1,187 @@
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import zipfile
+import numpy as np
+import pretty_midi
+from note_table import NoteTable
+from midi_conversion_api import MIDIConverter
+from audio_synthesis_api import WavetableSynth, normalize_preview, render_midi_stems
+from audio_buffers import encode_audio
+
+NOTE_COUNTS = (250, 2_500, 25_000)
+# Default density when total_beats is not given; keeps the longest default
+# run to a few minutes of audio
+NOTES_PER_BEAT = 32
+# Share of the note rows that goes to each track
+TRACK_SHARES = {"instrument": 0.5, "bass": 0.2, "drums": 0.3}
+GM_DRUM_PITCHES = (35, 36, 38, 40, 42, 44, 46, 49, 51)
+
+def synthetic_music_data(notes=1000, polyphony=1, tempo=120, total_beats=None, seed=0):
+    """Deterministic music_data with about `notes` sounding pitches.
+
+    Instrument events are chords of `polyphony` pitches; bass and drums
+    stay single-note. Onsets land on sixteenth notes spread across
+    `total_beats`, which defaults to enough beats for NOTES_PER_BEAT and
+    at least 20 seconds at `tempo`.
+    """
+    rng = np.random.default_rng(seed)
+    if total_beats is None:
+        total_beats = max(int(tempo / 3), -(-notes // NOTES_PER_BEAT))
+
+    def onsets(count, step=0.25):
+        return (np.sort(rng.integers(0, int(total_beats / step), count)) * step).tolist()
+
+    chords = max(1, int(notes * TRACK_SHARES["instrument"]) // polyphony)
+    roots = rng.integers(36, 72, chords)
+    instrument = []
+    for onset, root, duration in zip(onsets(chords), roots.tolist(),
+                                      rng.choice([0.25, 0.5, 1, 2], chords).tolist()):
+        note = {"time": onset, "duration": duration, "velocity": 100}
+        if polyphony == 1:
+            note["pitch"] = root
+        else:
+            # Stacked thirds, like the chords the model tends to write
+            note["pitches"] = [min(127, root + 4 * i - i // 2) for i in range(polyphony)]
+        instrument.append(note)
+
+    count = int(notes * TRACK_SHARES["bass"])
+    bass = [
+        {"pitch": pitch, "time": onset, "duration": 0.5, "velocity": 110}
+        for onset, pitch in zip(onsets(count), rng.integers(28, 52, count).tolist())
+    ]
+
+    count = int(notes * TRACK_SHARES["drums"])
+    drums = [
+        {"pitch": pitch, "time": onset, "duration": 0.25, "velocity": 90}
+        for onset, pitch in zip(onsets(count), rng.choice(GM_DRUM_PITCHES, count).tolist())
+    ]
+
+    return {
+        "tempo": tempo,
+        "time_signature": "4/4",
+        "total_beats": total_beats,
+        "instrument": {"program": 0, "notes": instrument},
+        "bass": {"program": 33, "notes": bass},
+        "drums": {"notes": drums}
+    }
+
+class StageTimer:
+    """Collects wall-clock seconds per named pipeline stage"""
+
+    def __init__(self):
+        self.seconds = {}
+
+    def time(self, stage, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + time.perf_counter() - start
+        return result
+
+def run_pipeline(text, work_dir):
+    """One pass over every stage, from response text to ZIP archive"""
+    timer = StageTimer()
+    table = timer.time("json_validation",
+                       lambda: NoteTable.from_music_data(json.loads(text)))
+
+    midi_files = {name: os.path.join(work_dir, f"{name}.mid")
+                  for name in ("instrument", "bass", "drums")}
+    result = timer.time("convert_to_midi", MIDIConverter().convert_to_midi, table,
+                        midi_files["instrument"], midi_files["bass"], midi_files["drums"])
+    if result["status"] != "success":
+        raise RuntimeError(result["message"])
+
+    midis = {
+        name: timer.time("midi_reload", pretty_midi.PrettyMIDI, midi_files[name])
+        for name in midi_files
+    }
+    # Fresh synth each pass so the note cache does not carry over
+    synth = WavetableSynth()
+    stems = {
+        name: timer.time(f"{name}_synth", render_midi_stems, midis[name], (name,), synth)[name]
+        for name in midis
+    }
+
+    normalized = {
+        name: timer.time("normalization", normalize_preview, audio)
+        for name, audio in stems.items()
+    }
+    for audio in normalized.values():
+        timer.time("wav_write", encode_audio, audio, "wav")
+
+    def build_zip():
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zipf:
+            for path in midi_files.values():
+                zipf.write(path, os.path.basename(path))
+        return archive.getvalue()
+    timer.time("zip_build", build_zip)
+
+    audio_seconds = max(len(audio) for audio in stems.values()) / synth.sample_rate
+    return timer.seconds, audio_seconds, len(table)
+
+def run_benchmark(note_counts=NOTE_COUNTS, polyphony=1, tempo=120, total_beats=None,
+                  repeat=3, seed=0):
+    """Median seconds per stage for each note count, as JSON-ready dicts"""
+    rows = []
+    for notes in note_counts:
+        music_data = synthetic_music_data(notes, polyphony, tempo, total_beats, seed)
+        text = json.dumps(music_data)
+        runs = []
+        with tempfile.TemporaryDirectory() as work_dir:
+            for _ in range(repeat):
+                runs.append(run_pipeline(text, work_dir))
+
+        stages = {stage: float(np.median([run[0][stage] for run in runs]))
+                  for stage in runs[0][0]}
+        rows.append({
+            "notes": notes,
+            "note_rows": runs[0][2],
+            "polyphony": polyphony,
+            "tempo": tempo,
+            "total_beats": music_data["total_beats"],
+            "json_bytes": len(text),
+            "audio_seconds": runs[0][1],
+            "stages_s": stages,
+            "total_s": sum(stages.values())
+        })
+    return {
+        "repeat": repeat,
+        "seed": seed,
+        "results": rows
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time each stage of the music pipeline on synthetic compositions"
+    )
+    parser.add_argument("--notes", type=int, nargs="+", default=list(NOTE_COUNTS),
+                        help="note counts to run (default: %(default)s)")
+    parser.add_argument("--polyphony", type=int, default=1,
+                        help="pitches per instrument chord (default: 1)")
+    parser.add_argument("--tempo", type=int, default=120, help="BPM (default: 120)")
+    parser.add_argument("--total-beats", type=int, default=None,
+                        help=f"composition length (default: notes / {NOTES_PER_BEAT})")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs per size; medians are reported (default: 3)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default=None,
+                        help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.notes, args.polyphony, args.tempo, args.total_beats,
+                           args.repeat, args.seed)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
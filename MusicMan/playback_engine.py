@@ -0,0 +1,250 @@
+import threading
+import time
+from collections import deque
+import numpy as np
+from audio_synthesis_api import SAMPLE_RATE, PREVIEW_PEAK, STEM_LEVELS, LoopedStem
+
+# Samples mixed per block; control changes are heard within about two
+# blocks plus the device buffer
+PLAYBACK_BLOCK_SIZE = 2048
+# Latency samples kept for the reported mean and max
+LATENCY_WINDOW = 64
+# Samples summed per step when measuring the mix peak
+PEAK_BLOCK_SIZE = 1 << 16
+
+class PygameOutput:
+    """Plays mixed blocks gaplessly on one pygame mixer channel.
+
+    A channel holds one playing and one queued sound, so at most two
+    blocks are in flight. `device_buffer` is the buffer size the mixer was
+    initialized with; pygame cannot report it.
+    """
+
+    def __init__(self, mixer, channel=0, device_buffer=4096):
+        self.mixer = mixer
+        self.channel = mixer.Channel(channel)
+        self.frequency, _, self.channels = mixer.get_init()
+        self.device_latency = device_buffer / self.frequency
+
+    def ready(self):
+        """True when another block can be queued"""
+        return self.channel.get_queue() is None
+
+    def busy(self):
+        return self.channel.get_busy()
+
+    def write(self, block):
+        """Queue `block`; returns True if it started playing right away"""
+        pcm = (np.clip(block, -1.0, 1.0) * 32767).astype(np.int16)
+        # Same signal on every output channel the mixer was opened with
+        sound = self.mixer.Sound(buffer=np.repeat(pcm[:, None], self.channels, axis=1).tobytes())
+        if self.channel.get_busy():
+            self.channel.queue(sound)
+            return False
+        self.channel.play(sound)
+        return True
+
+    def stop(self):
+        self.channel.stop()
+
+class ChannelPool:
+    """Hands every session its own block of `block` mixer channels.
+
+    Sessions share one pygame mixer, so playing or stopping on a session's
+    own channels never touches another session's sound. The engine a
+    session plays through is kept with its block, so a session that
+    disconnects mid-playback is stopped before its channels are reused.
+    """
+
+    def __init__(self, block):
+        self.block = block
+        # session id -> [block index, PlaybackEngine or None]
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        """Mixer channels needed to cover every block handed out"""
+        with self._lock:
+            blocks = max((entry[0] for entry in self._sessions.values()), default=-1) + 1
+        return blocks * self.block
+
+    def acquire(self, session_id):
+        """First channel of the session's block, assigning the lowest free
+        block on first use"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                taken = {index for index, _ in self._sessions.values()}
+                index = next(i for i in range(len(taken) + 1) if i not in taken)
+                entry = self._sessions[session_id] = [index, None]
+            return entry[0] * self.block
+
+    def get(self, session_id):
+        """First channel of the session's block, or None if it has none"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+        return None if entry is None else entry[0] * self.block
+
+    def attach(self, session_id, engine):
+        """Remember the engine playing on the session's block"""
+        with self._lock:
+            self._sessions[session_id][1] = engine
+
+    def release(self, session_id):
+        """Stop the session's engine and free its block"""
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+        if entry is not None and entry[1] is not None:
+            entry[1].stop()
+
+    def prune(self, is_active):
+        """Release every session for which `is_active(id)` is False"""
+        with self._lock:
+            inactive = [session_id for session_id in self._sessions if not is_active(session_id)]
+        for session_id in inactive:
+            self.release(session_id)
+
+class PlaybackEngine:
+    """Mixes stems into one output stream, block by block, in a thread.
+
+    Every stem is read from the same sample position, so they start
+    together and stay aligned. Gain, mute and solo are read once per
+    block, so a change is applied from the next block mixed. `stems` are
+    the raw rendered stems, as arrays or LoopedStems, scaled by `levels`
+    like mixdown; their unity-gain sum is normalized to `peak`, and raised
+    gains clip at full scale. Stems are only ever read a block at a time,
+    so a LoopedStem is never tiled out in full.
+    """
+
+    def __init__(self, stems, output, sample_rate=SAMPLE_RATE,
+                 block_size=PLAYBACK_BLOCK_SIZE, peak=PREVIEW_PEAK, levels=STEM_LEVELS):
+        self.stems = {
+            name: (audio.astype(np.float32) if isinstance(audio, LoopedStem)
+                   else np.asarray(audio, dtype=np.float32))
+            for name, audio in stems.items()
+        }
+        self.output = output
+        self.sample_rate = sample_rate
+        self.block_size = block_size
+        self.length = max((len(audio) for audio in self.stems.values()), default=0)
+
+        self.levels = {name: levels.get(name, 1.0) for name in self.stems}
+        mix_peak = 0.0
+        for start in range(0, self.length, PEAK_BLOCK_SIZE):
+            mix = np.zeros(min(PEAK_BLOCK_SIZE, self.length - start), dtype=np.float32)
+            for name, audio in self.stems.items():
+                segment = audio[start:start + PEAK_BLOCK_SIZE]
+                mix[:len(segment)] += self.levels[name] * segment
+            mix_peak = max(mix_peak, float(np.max(np.abs(mix))))
+        self.master_gain = peak / mix_peak if mix_peak > 0 else 0.0
+
+        self.gains = {name: 1.0 for name in self.stems}
+        self.muted = set()
+        self.soloed = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.position = 0
+        self.underruns = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def set_gain(self, name, gain):
+        with self._lock:
+            self.gains[name] = float(gain)
+
+    def set_mute(self, name, muted=True):
+        with self._lock:
+            (self.muted.add if muted else self.muted.discard)(name)
+
+    def set_solo(self, name, soloed=True):
+        with self._lock:
+            (self.soloed.add if soloed else self.soloed.discard)(name)
+
+    def scales(self):
+        """Linear scale per stem for the next block"""
+        with self._lock:
+            audible = self.soloed or set(self.stems)
+            return {
+                name: (self.gains[name] * self.levels[name] * self.master_gain
+                       if name in audible and name not in self.muted else 0.0)
+                for name in self.stems
+            }
+
+    def mix_block(self, start):
+        """The mix of samples [start, start + block_size) at current settings"""
+        stop = min(start + self.block_size, self.length)
+        block = np.zeros(stop - start, dtype=np.float32)
+        for name, scale in self.scales().items():
+            segment = self.stems[name][start:stop]
+            if scale and len(segment):
+                block[:len(segment)] += scale * segment
+        return block
+
+    @property
+    def playing(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, position=0.0):
+        """Play from `position` seconds on a background thread"""
+        self.stop()
+        self.position = int(position * self.sample_rate)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.output.stop()
+
+    def _run(self):
+        block_seconds = self.block_size / self.sample_rate
+        in_flight = None
+        started = False
+        while not self._stop.is_set():
+            if not self.output.ready():
+                self._stop.wait(block_seconds / 8)
+                continue
+            now = time.perf_counter()
+            if in_flight is not None:
+                # The queued block just moved up to playing
+                self._latencies.append(now - in_flight)
+                in_flight = None
+            if started and not self.output.busy():
+                self.underruns += 1
+            if self.position >= self.length:
+                break
+
+            mixed_at = time.perf_counter()
+            block = self.mix_block(self.position)
+            self.position += len(block)
+            started = True
+            if self.output.write(block):
+                self._latencies.append(time.perf_counter() - mixed_at)
+            else:
+                in_flight = mixed_at
+
+    def latency(self):
+        """Measured output latency in milliseconds.
+
+        `queue_ms` is the time from a block being mixed, with the settings
+        current at that moment, to the output starting it; `device_ms` adds
+        the output's own buffer.
+        """
+        device = getattr(self.output, "device_latency", 0.0)
+        measured = list(self._latencies)
+        if not measured:
+            return {"block_ms": self.block_size / self.sample_rate * 1000,
+                    "queue_ms": None, "max_queue_ms": None,
+                    "device_ms": device * 1000, "total_ms": None}
+        mean = sum(measured) / len(measured)
+        return {
+            "block_ms": self.block_size / self.sample_rate * 1000,
+            "queue_ms": mean * 1000,
+            "max_queue_ms": max(measured) * 1000,
+            "device_ms": device * 1000,
+            "total_ms": (mean + device) * 1000
+        }
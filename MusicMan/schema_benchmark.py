@@ -0,0 +1,112 @@
+import json
+import re
+import time
+from fake_openai_server import CANNED_MUSIC_DATA, start_fake_server
+from music_generation_api import SCHEMAS, MusicGenerator
+from compact_schema import decode_compact, encode_compact
+from pipeline_benchmark import synthetic_music_data
+
+# Prompt -> composition the stub answers with; a fixed set so runs compare
+FIXED_PROMPTS = {
+    "canned lofi loop": CANNED_MUSIC_DATA,
+    "sparse ambient pad": synthetic_music_data(notes=120, polyphony=3, tempo=72, seed=1),
+    "busy drum and bass": synthetic_music_data(notes=400, tempo=170, seed=2),
+    "dense jazz chords": synthetic_music_data(notes=600, polyphony=4, tempo=132, seed=3),
+}
+# The stub streams characters at a fixed rate (6400 chars/s), so its
+# latency is just response length over that rate. The latency columns only
+# restate the character saving; they are not a measurement of real model
+# latency, which depends on output tokens and server load.
+CHUNK_SIZE = 64
+CHUNK_DELAY = 0.01
+DECODE_REPEAT = 50
+
+def count_tokens(text):
+    """(tokens, exact) for `text`, exact when tiktoken's cl100k_base is
+    installed.
+
+    Otherwise an estimate: numbers in runs of up to three digits, words and
+    single punctuation marks each count as one token, which tracks
+    cl100k_base closely on JSON like this.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        return len(re.findall(r"\d{1,3}|[A-Za-z_]+|[^\sA-Za-z\d_]", text)), False
+    return len(tiktoken.get_encoding("cl100k_base").encode(text)), True
+
+def response_text(music_data, schema):
+    """What a model following `schema` would send for music_data"""
+    return json.dumps(encode_compact(music_data) if schema == "compact" else music_data)
+
+def run_prompt(server, base_url, prompt, music_data, schema):
+    content = response_text(music_data, schema)
+    server.content = content
+    generator = MusicGenerator(api_key="benchmark", base_url=base_url, schema=schema)
+
+    start = time.perf_counter()
+    result = generator.generate_music_data(prompt)
+    latency = time.perf_counter() - start
+
+    # Parse plus decode, what a response costs on our side
+    start = time.perf_counter()
+    for _ in range(DECODE_REPEAT):
+        data = json.loads(content)
+        if schema == "compact":
+            decode_compact(data)
+    decode = (time.perf_counter() - start) / DECODE_REPEAT
+
+    tokens, exact = count_tokens(content)
+    return {
+        "chars": len(content),
+        "tokens": tokens,
+        "exact_tokens": exact,
+        "latency_s": latency,
+        "decode_ms": decode * 1000,
+        # The decoded result must be the composition the stub was given
+        "round_trip": result.get("music_data") == music_data
+    }
+
+def run_benchmark(prompts=FIXED_PROMPTS, chunk_size=CHUNK_SIZE, chunk_delay=CHUNK_DELAY):
+    server, base_url = start_fake_server(chunk_size=chunk_size, chunk_delay=chunk_delay)
+    try:
+        rows = []
+        for prompt, music_data in prompts.items():
+            row = {"prompt": prompt}
+            for schema in SCHEMAS:
+                row[schema] = run_prompt(server, base_url, prompt, music_data, schema)
+            rows.append(row)
+    finally:
+        server.shutdown()
+    return {
+        "system_prompt_tokens": {schema: count_tokens(text)[0] for schema, text in SCHEMAS.items()},
+        "results": rows
+    }
+
+def saving(before, after):
+    return 1 - after / before if before else 0.0
+
+if __name__ == "__main__":
+    report = run_benchmark()
+    rows = report["results"]
+    exact = all(row[schema]["exact_tokens"] for row in rows for schema in SCHEMAS)
+    print(f"Output tokens ({'cl100k_base' if exact else 'estimated, tiktoken not installed'})")
+    print(f"{'prompt':<22} {'verbose':>8} {'compact':>8} {'saved':>6} "
+          f"{'stub verb s':>10} {'stub comp s':>10} {'saved':>6} {'decode ms':>10} {'round trip':>11}")
+    for row in rows:
+        verbose, compact = row["verbose"], row["compact"]
+        print(f"{row['prompt']:<22} {verbose['tokens']:>8} {compact['tokens']:>8} "
+              f"{saving(verbose['tokens'], compact['tokens']):>6.0%} "
+              f"{verbose['latency_s']:>10.2f} {compact['latency_s']:>10.2f} "
+              f"{saving(verbose['latency_s'], compact['latency_s']):>6.0%} "
+              f"{compact['decode_ms']:>10.2f} {str(compact['round_trip'] and verbose['round_trip']):>11}")
+    totals = {schema: (sum(row[schema]["tokens"] for row in rows),
+                       sum(row[schema]["latency_s"] for row in rows)) for schema in SCHEMAS}
+    print(f"{'total':<22} {totals['verbose'][0]:>8} {totals['compact'][0]:>8} "
+          f"{saving(totals['verbose'][0], totals['compact'][0]):>6.0%} "
+          f"{totals['verbose'][1]:>10.2f} {totals['compact'][1]:>10.2f} "
+          f"{saving(totals['verbose'][1], totals['compact'][1]):>6.0%}")
+    prompt_tokens = report["system_prompt_tokens"]
+    print(f"System prompt tokens: verbose {prompt_tokens['verbose']}, compact {prompt_tokens['compact']}")
+    print(f"Stub latency is characters / {CHUNK_SIZE / CHUNK_DELAY:.0f} chars/s, "
+          "so its saving is a stub artifact, not a measured model speedup")
@@ -0,0 +1,127 @@
+import struct
+import numpy as np
+
+TICKS_PER_QUARTERNOTE = 960
+MAX_DELTA = 0x0FFFFFFF  # largest four-byte variable-length quantity
+END_OF_TRACK = b'\x00\xff\x2f\x00'
+
+def _chunk(tag, data):
+    return tag + struct.pack('>L', len(data)) + data
+
+def vlq_lengths(values):
+    """Bytes needed to write each value as a variable-length quantity"""
+    return 1 + (values >= 1 << 7) + (values >= 1 << 14) + (values >= 1 << 21)
+
+def vlq_bytes(value):
+    """A single value as variable-length quantity bytes"""
+    groups = [value & 0x7F]
+    value >>= 7
+    while value:
+        groups.append(0x80 | (value & 0x7F))
+        value >>= 7
+    return groups[::-1]
+
+def encode_events(ticks, status, data1, data2):
+    """Pack channel events already in time order into MTrk body bytes.
+
+    Each event is a delta-time followed by three bytes; all of it is laid
+    out with array writes rather than per-event packing.
+    """
+    deltas = np.diff(ticks, prepend=0)
+    if len(deltas) and (deltas.min() < 0 or deltas.max() > MAX_DELTA):
+        raise ValueError("Event times must be sorted and fit in a MIDI delta-time")
+
+    widths = vlq_lengths(deltas)
+    ends = np.cumsum(widths + 3)
+    starts = ends - widths - 3
+    out = np.empty(ends[-1] if len(ends) else 0, dtype=np.uint8)
+
+    # Big-endian 7-bit groups, continuation bit on all but the last
+    for byte in range(4):
+        has_byte = widths > byte
+        shift = 7 * (widths[has_byte] - 1 - byte)
+        group = (deltas[has_byte] >> shift) & 0x7F
+        more = np.where(byte < widths[has_byte] - 1, 0x80, 0)
+        out[starts[has_byte] + byte] = group | more
+    out[ends - 3] = status
+    out[ends - 2] = data1
+    out[ends - 1] = data2
+    return out.tobytes()
+
+def note_events(notes, channel, ticks_per_quarternote=TICKS_PER_QUARTERNOTE):
+    """Sorted (tick, status, pitch, velocity) columns for a NoteTable track.
+
+    Orders events the way MIDIUtil does (by tick, note-offs before note-ons,
+    then by insertion order). Only tracks without zero-length notes or
+    same-pitch overlaps encode to the bytes MIDIUtil writes. Zero-length
+    notes and repeated onsets of the same pitch are dropped, and a note
+    still sounding when its pitch is struck again is cut at the new onset
+    so note-offs pair up unambiguously. Such a file then differs from
+    MIDIUtil's (which loses overlapping notes when read back) and from
+    the preview, which renders the NoteTable with the overlap intact.
+    """
+    on_ticks = (notes['time'] * ticks_per_quarternote).astype(np.int64)
+    off_ticks = on_ticks + (notes['duration'] * ticks_per_quarternote).astype(np.int64)
+    sounding = np.flatnonzero(off_ticks > on_ticks)
+    _, first = np.unique(on_ticks[sounding] * 128 + notes['pitch'][sounding],
+                         return_index=True)
+    keep = np.zeros(len(notes), dtype=bool)
+    keep[sounding[first]] = True
+
+    by_pitch = np.flatnonzero(keep)
+    by_pitch = by_pitch[np.lexsort((on_ticks[by_pitch], notes['pitch'][by_pitch]))]
+    next_on = np.append(on_ticks[by_pitch][1:], MAX_DELTA)
+    same_pitch = np.append(notes['pitch'][by_pitch][1:] == notes['pitch'][by_pitch][:-1], False)
+    cut = same_pitch & (next_on < off_ticks[by_pitch])
+    off_ticks[by_pitch[cut]] = next_on[cut]
+
+    order = np.flatnonzero(keep)
+    count = len(order)
+    ticks = np.concatenate([off_ticks[order], on_ticks[order]])
+    is_on = np.repeat([0, 1], count)
+    sequence = np.concatenate([order, order])
+    events = np.lexsort((sequence, is_on, ticks))
+
+    status = np.where(is_on[events] == 1, 0x90 | channel, 0x80 | channel)
+    pitches = np.concatenate([notes['pitch'][order]] * 2)[events]
+    velocities = np.concatenate([notes['velocity'][order]] * 2)[events]
+    return ticks[events], status, pitches, velocities
+
+def encode_note_track(notes, channel, program=None, name=None,
+                      ticks_per_quarternote=TICKS_PER_QUARTERNOTE):
+    """One MTrk chunk holding an optional track name and program change,
+    then every note of a track"""
+    body = b''
+    if name is not None:
+        encoded = name.encode("latin-1")
+        body += b'\x00\xff\x03' + bytes(vlq_bytes(len(encoded))) + encoded
+    if program is not None:
+        body += bytes([0x00, 0xC0 | channel, program])
+    body += encode_events(*note_events(notes, channel, ticks_per_quarternote))
+    return _chunk(b'MTrk', body + END_OF_TRACK)
+
+def encode_tempo_track(tempo):
+    microseconds = int(60000000 / tempo)
+    body = b'\x00\xff\x51\x03' + struct.pack('>L', microseconds)[1:]
+    return _chunk(b'MTrk', body + END_OF_TRACK)
+
+def encode_midi_file(tempo, tracks, ticks_per_quarternote=TICKS_PER_QUARTERNOTE):
+    """Bytes of a type-1 Standard MIDI File.
+
+    `tracks` is a list of (notes, channel, program, name) with `notes` a
+    NoteTable track array; `program` or `name` may be None to leave that
+    event out. A tempo track comes first, as MIDIUtil writes it.
+    """
+    header = _chunk(b'MThd', struct.pack('>HHH', 1, len(tracks) + 1,
+                                         ticks_per_quarternote))
+    chunks = [header, encode_tempo_track(tempo)]
+    for notes, channel, program, name in tracks:
+        chunks.append(encode_note_track(notes, channel, program, name,
+                                        ticks_per_quarternote))
+    return b''.join(chunks)
+
+def write_midi_file(path, tempo, tracks, ticks_per_quarternote=TICKS_PER_QUARTERNOTE):
+    data = encode_midi_file(tempo, tracks, ticks_per_quarternote)
+    with open(path, "wb") as f:
+        f.write(data)
+    return len(data)
@@ -0,0 +1,126 @@
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; max RSS falls back to psutil if present
+    resource = None
+
+STAGE_LOG_FILE = os.path.join("generated_music", "stage_timings.jsonl")
+STAGE_LOG_MAX_BYTES = 5 * 1024 * 1024
+STAGE_LOG_BACKUPS = 5
+
+def max_rss_mb():
+    """Highest resident memory this process has reached since it started,
+    in MiB, or None. A high-water mark: it never goes down."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    try:
+        import psutil
+    except ImportError:
+        return None
+    memory = psutil.Process().memory_info()
+    return getattr(memory, "peak_wset", memory.rss) / (1024 * 1024)
+
+def open_stage_log(path=STAGE_LOG_FILE, max_bytes=STAGE_LOG_MAX_BYTES,
+                   backup_count=STAGE_LOG_BACKUPS):
+    """Logger that appends one JSON span per line to `path`, rotating by size"""
+    logger = logging.getLogger(f"stage_timing.{os.path.abspath(path)}")
+    if not logger.handlers:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        handler = RotatingFileHandler(path, maxBytes=max_bytes,
+                                      backupCount=backup_count, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+class StageRecorder:
+    """Times named stages and keeps the most recent spans.
+
+    Each span records wall time and the CPU time of the calling thread,
+    so concurrent sessions in other threads do not count against it. CPU
+    spent in worker processes or threads (stem rendering, playback) shows
+    up as wall time without matching CPU time here.
+
+    Memory is the process's lifetime RSS high-water mark, shared by every
+    session: `max_rss_mb` is its value when the stage ended and
+    `max_rss_growth_mb` how far the stage pushed it up, which stays 0 for
+    a stage that allocates less than the process once held.
+    """
+
+    def __init__(self, session_id=None, logger=None, keep=100):
+        self.session_id = session_id
+        self.logger = logger
+        self.spans = deque(maxlen=keep)
+
+    @contextmanager
+    def span(self, stage, **fields):
+        """Time the body of a with-block as `stage`; extra fields are logged"""
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        rss_start = max_rss_mb()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            rss_end = max_rss_mb()
+            record = {
+                "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+                "session": self.session_id,
+                "stage": stage,
+                "wall_s": round(time.perf_counter() - wall_start, 6),
+                "cpu_s": round(time.thread_time() - cpu_start, 6),
+                "max_rss_mb": None if rss_end is None else round(rss_end, 1),
+                "max_rss_growth_mb": None if rss_end is None else round(rss_end - rss_start, 1),
+                "error": error,
+                **fields
+            }
+            self.spans.append(record)
+            if self.logger is not None:
+                self.logger.info(json.dumps(record))
+
+    def totals(self):
+        """Summed wall and CPU seconds per stage over the kept spans"""
+        totals = {}
+        for record in self.spans:
+            entry = totals.setdefault(record["stage"], {"count": 0, "wall_s": 0.0, "cpu_s": 0.0})
+            entry["count"] += 1
+            entry["wall_s"] += record["wall_s"]
+            entry["cpu_s"] += record["cpu_s"]
+        return totals
+
+def read_stage_log(path):
+    """Every span in `path` and its rotated backups, oldest file first"""
+    paths = [f"{path}.{i}" for i in range(STAGE_LOG_BACKUPS, 0, -1)] + [path]
+    spans = []
+    for log_path in paths:
+        if os.path.exists(log_path):
+            with open(log_path, encoding="utf-8") as f:
+                spans.extend(json.loads(line) for line in f if line.strip())
+    return spans
+
+if __name__ == "__main__":
+    # Aggregate a stage log across sessions: python stage_timing.py [log]
+    path = sys.argv[1] if len(sys.argv) > 1 else STAGE_LOG_FILE
+    recorder = StageRecorder(keep=None)
+    recorder.spans.extend(read_stage_log(path))
+    print(f"{'stage':<32} {'count':>6} {'mean wall (ms)':>15} {'mean cpu (ms)':>14}")
+    for stage, entry in sorted(recorder.totals().items()):
+        print(f"{stage:<32} {entry['count']:>6} "
+              f"{entry['wall_s'] / entry['count'] * 1000:>15.1f} "
+              f"{entry['cpu_s'] / entry['count'] * 1000:>14.1f}")
@@ -0,0 +1,54 @@
+import importlib
+import re
+import subprocess
+import sys
+import time
+
+# Heavy third-party modules and the app modules that pull them in
+REPORT_MODULES = (
+    "streamlit", "numpy", "pygame", "pretty_midi", "soundfile", "midiutil",
+    "openai", "audio_synthesis_api", "midi_conversion_api",
+    "music_generation_api", "mixdown_api"
+)
+
+# Seconds spent on the first import of each module through lazy_import
+IMPORT_TIMINGS = {}
+
+def lazy_import(name):
+    """Import `name` on first use and record what that first import cost.
+
+    Modules already loaded by an earlier import cost close to nothing here,
+    so the timings show what each lazy load actually added.
+    """
+    module = sys.modules.get(name)
+    if module is None:
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        IMPORT_TIMINGS[name] = time.perf_counter() - start
+    return module
+
+def cold_import_cost(name):
+    """Cumulative import time of `name` in a fresh interpreter, in seconds"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {name}"],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        return None
+    # Lines look like "import time:  self [us] | cumulative | name"; the
+    # requested module is the last top-level entry
+    for line in reversed(result.stderr.splitlines()):
+        match = re.match(r"import time:\s*(\d+)\s*\|\s*(\d+)\s*\|\s*(\S+)$", line)
+        if match and match.group(3) == name:
+            return int(match.group(2)) / 1e6
+    return None
+
+def import_report(modules=REPORT_MODULES):
+    """Cold import cost per module, each measured in its own interpreter"""
+    return {name: cold_import_cost(name) for name in modules}
+
+if __name__ == "__main__":
+    print(f"{'module':<24} {'cold import (ms)':>16}")
+    for name, seconds in import_report().items():
+        cost = "not installed" if seconds is None else f"{seconds * 1000:.1f}"
+        print(f"{name:<24} {cost:>16}")
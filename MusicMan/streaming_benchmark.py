@@ -0,0 +1,63 @@
+import json
+import time
+from fake_openai_server import CANNED_MUSIC_DATA, start_fake_server
+from music_generation_api import MusicGenerator
+from audio_synthesis_api import StreamingStemRenderer, WavetableSynth, render_stems
+
+# About 1600 characters per second; slow the stub down to match real
+# token rates when comparing against production numbers
+CHUNK_SIZE = 16
+CHUNK_DELAY = 0.01
+
+def blocking_run(generator):
+    """Current path: wait for the whole response, then synthesize"""
+    start = time.perf_counter()
+    result = generator.generate_music_data("benchmark")
+    response_done = time.perf_counter()
+    render_stems(result["music_data"], WavetableSynth())
+    # Counted generously: the first note is synthesized just after this
+    return {
+        "first_note_s": response_done - start,
+        "stems_ready_s": time.perf_counter() - start
+    }
+
+def streaming_run(generator):
+    """Streaming path: synthesize notes while the response is arriving.
+
+    No audio can be played or written before stems() returns, so
+    `stems_ready_s` is the figure to compare with the blocking path;
+    `first_note_s` only shows how early synthesis starts.
+    """
+    renderer = StreamingStemRenderer(WavetableSynth())
+    start = time.perf_counter()
+    generator.stream_music_data(
+        "benchmark", on_note=renderer.on_note, on_field=renderer.on_field
+    )
+    renderer.stems()
+    return {
+        "first_note_s": renderer.first_note_at - start,
+        "stems_ready_s": time.perf_counter() - start
+    }
+
+def run_benchmark(content=None, chunk_size=CHUNK_SIZE, chunk_delay=CHUNK_DELAY):
+    content = json.dumps(CANNED_MUSIC_DATA) if content is None else content
+    server, base_url = start_fake_server(
+        content=content, chunk_size=chunk_size, chunk_delay=chunk_delay
+    )
+    try:
+        generator = MusicGenerator(api_key="benchmark", base_url=base_url)
+        return {
+            "response_chars": len(content),
+            "blocking": blocking_run(generator),
+            "streaming": streaming_run(generator)
+        }
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    results = run_benchmark()
+    print(f"Response size: {results['response_chars']} chars")
+    for mode in ("blocking", "streaming"):
+        row = results[mode]
+        print(f"{mode:>10}: first note synthesized {row['first_note_s']:.2f}s, "
+              f"all stems (first playable audio) {row['stems_ready_s']:.2f}s")
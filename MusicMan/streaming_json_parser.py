@@ -0,0 +1,135 @@
+import json
+
+TRACK_NAMES = ('instrument', 'bass', 'drums')
+
+class NoteStreamParser:
+    """Incremental parser for music_data JSON arriving in text chunks.
+
+    Every note inside `instrument`/`bass`/`drums` -> `notes` is handed to
+    `on_note(track, note)` as soon as its closing brace or bracket arrives,
+    after `note_decoder` if one is given (compact_schema.decode_note for
+    array notes). Top-level scalars such as `tempo` go to
+    `on_field(key, value)`, and a track's `program` to
+    `on_field("<track>.program", value)`. `finish()` parses the complete
+    document.
+    """
+
+    def __init__(self, on_note=None, on_field=None, note_decoder=None):
+        self.on_note = on_note
+        self.on_field = on_field
+        self.note_decoder = note_decoder
+        self.note_counts = {name: 0 for name in TRACK_NAMES}
+        self._chunks = []
+        # Unconsumed text; only kept from the start of an open token or note
+        self._buf = ""
+        self._pos = 0
+        # Open containers as [opener, key in parent, start offset in _buf]
+        self._stack = []
+        self._key = None
+        self._expect_key = False
+        self._in_string = False
+        self._escape = False
+        self._token_start = None
+        self._value_start = None
+
+    def _path(self):
+        return [frame[1] for frame in self._stack]
+
+    def _in_notes_array(self):
+        """True when the innermost container is <track>.notes"""
+        return (len(self._stack) == 3 and self._stack[-1][0] == '['
+                and self._stack[-1][1] == 'notes'
+                and self._stack[1][1] in TRACK_NAMES)
+
+    def _emit_field(self, raw):
+        if self.on_field is None:
+            return
+        path = self._path()[1:] + [self._key]
+        if len(path) == 1 or (len(path) == 2 and path[0] in TRACK_NAMES):
+            try:
+                self.on_field(".".join(path), json.loads(raw))
+            except ValueError:
+                pass
+
+    def feed(self, text):
+        """Consume the next chunk of the response"""
+        self._chunks.append(text)
+        self._buf += text
+        buf = self._buf
+        i = self._pos
+
+        while i < len(buf):
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    raw = buf[self._token_start:i + 1]
+                    self._token_start = None
+                    if self._expect_key:
+                        self._key = json.loads(raw)
+                        self._expect_key = False
+                    elif self._value_start is not None:
+                        self._emit_field(raw)
+                        self._value_start = None
+                i += 1
+                continue
+
+            if self._value_start is not None and ch in ',}] \t\r\n':
+                # End of a bare scalar (number, true, false, null)
+                self._emit_field(buf[self._value_start:i])
+                self._value_start = None
+
+            if ch == '"':
+                self._in_string = True
+                self._token_start = i
+                if not self._expect_key and self._stack and self._stack[-1][0] == '{':
+                    self._value_start = i
+            elif ch in '{[':
+                self._stack.append([ch, self._key, i])
+                self._key = None
+                self._expect_key = ch == '{'
+            elif ch in '}]':
+                opener, key, start = self._stack.pop()
+                if self._in_notes_array():
+                    track = self._stack[1][1]
+                    note = json.loads(buf[start:i + 1])
+                    if self.note_decoder is not None:
+                        note = self.note_decoder(note)
+                    self.note_counts[track] += 1
+                    if self.on_note is not None:
+                        self.on_note(track, note)
+                self._key = key
+                self._expect_key = False
+            elif ch == ',':
+                self._expect_key = bool(self._stack) and self._stack[-1][0] == '{'
+            elif ch not in ' \t\r\n:' and self._value_start is None \
+                    and self._stack and self._stack[-1][0] == '{':
+                self._value_start = i
+            i += 1
+
+        # Drop text nobody can refer back to any more
+        keep = i
+        for start in (self._token_start, self._value_start):
+            if start is not None:
+                keep = min(keep, start)
+        if len(self._stack) >= 4:
+            # Inside a note object; it is parsed whole once it closes
+            keep = min(keep, self._stack[3][2])
+        if keep:
+            self._buf = buf[keep:]
+            for frame in self._stack:
+                frame[2] -= keep
+            if self._token_start is not None:
+                self._token_start -= keep
+            if self._value_start is not None:
+                self._value_start -= keep
+            i -= keep
+        self._pos = i
+
+    def finish(self):
+        """Parse the whole document once the stream has ended"""
+        return json.loads("".join(self._chunks))
@@ -0,0 +1,111 @@
+import numpy as np
+from audio_synthesis_api import SAMPLE_RATE, LoopedStem
+
+# Samples per bin at the finest level, and bins merged per coarser level
+OVERVIEW_BASE = 256
+OVERVIEW_FACTOR = 4
+# Points drawn per chart series, whatever the zoom or track length
+OVERVIEW_POINTS = 1500
+
+# Finest-level bins reduced per step, so each slice of audio is still in
+# cache when its max is taken right after its min
+_CHUNK_BINS = 512
+
+def _envelope(audio, base):
+    """Per-bin min and max of `audio`, one chunk of bins at a time; only
+    slices of `audio` are read, so a LoopedStem is tiled chunk by chunk"""
+    n_bins = -(-len(audio) // base)
+    mins = np.empty(n_bins, dtype=np.float32)
+    maxs = np.empty(n_bins, dtype=np.float32)
+    step = _CHUNK_BINS * base
+    for first in range(0, len(audio), step):
+        chunk = audio[first:first + step]
+        whole = len(chunk) // base
+        bins = chunk[:whole * base].reshape(whole, base)
+        at = first // base
+        mins[at:at + whole] = bins.min(axis=1)
+        maxs[at:at + whole] = bins.max(axis=1)
+        if whole * base < len(chunk):
+            tail = chunk[whole * base:]
+            mins[-1], maxs[-1] = tail.min(), tail.max()
+    return mins, maxs
+
+def _coarsen(mins, maxs, factor):
+    """Merge every `factor` neighbouring bins; a short last group stays"""
+    whole = len(mins) // factor * factor
+    coarse_mins = mins[:whole].reshape(-1, factor).min(axis=1)
+    coarse_maxs = maxs[:whole].reshape(-1, factor).max(axis=1)
+    if whole < len(mins):
+        coarse_mins = np.append(coarse_mins, mins[whole:].min())
+        coarse_maxs = np.append(coarse_maxs, maxs[whole:].max())
+    return coarse_mins, coarse_maxs
+
+class WaveformPyramid:
+    """Min/max envelope of a stem at every zoom level.
+
+    Level 0 holds one (min, max) pair per `base` samples; each level above
+    merges `factor` bins of the one below, up to a level of at most
+    `factor` bins. `view` picks the finest level that fits a time range in
+    a fixed number of points, so a chart never gets more than that.
+    """
+
+    def __init__(self, levels, n_samples, sample_rate=SAMPLE_RATE,
+                 base=OVERVIEW_BASE, factor=OVERVIEW_FACTOR):
+        self.levels = levels
+        self.n_samples = n_samples
+        self.sample_rate = sample_rate
+        self.base = base
+        self.factor = factor
+
+    @classmethod
+    def from_audio(cls, audio, sample_rate=SAMPLE_RATE, base=OVERVIEW_BASE,
+                   factor=OVERVIEW_FACTOR):
+        """Build the pyramid from one pass over the samples; every coarser
+        level is reduced from the level below, not from the audio"""
+        if not isinstance(audio, LoopedStem):
+            audio = np.asarray(audio)
+        if not len(audio):
+            empty = np.zeros(0, dtype=np.float32)
+            return cls([(empty, empty)], 0, sample_rate, base, factor)
+
+        levels = [_envelope(audio, base)]
+        while len(levels[-1][0]) > factor:
+            levels.append(_coarsen(*levels[-1], factor))
+        return cls(levels, len(audio), sample_rate, base, factor)
+
+    @property
+    def duration(self):
+        return self.n_samples / self.sample_rate
+
+    @property
+    def peak(self):
+        """Largest absolute sample value, read off the coarsest level"""
+        mins, maxs = self.levels[-1]
+        if not len(mins):
+            return 0.0
+        return float(max(-mins.min(), maxs.max()))
+
+    @property
+    def nbytes(self):
+        return sum(mins.nbytes + maxs.nbytes for mins, maxs in self.levels)
+
+    def bin_seconds(self, level):
+        return self.base * self.factor ** level / self.sample_rate
+
+    def view(self, start=0.0, end=None, max_points=OVERVIEW_POINTS):
+        """(times, mins, maxs) covering `start`-`end` seconds in at most
+        `max_points` bins, from the finest level that fits.
+
+        Times are bin starts in seconds. The coarsest level is used when
+        even it has more bins than `max_points` in the range.
+        """
+        end = self.duration if end is None else min(end, self.duration)
+        start = max(0.0, min(start, end))
+        for level, (mins, maxs) in enumerate(self.levels):
+            seconds = self.bin_seconds(level)
+            first = int(start // seconds)
+            last = min(len(mins), int(np.ceil(end / seconds)))
+            if last - first <= max_points or level == len(self.levels) - 1:
+                break
+        times = np.arange(first, last) * seconds
+        return times, mins[first:last], maxs[first:last]